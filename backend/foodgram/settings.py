@@ -86,6 +86,52 @@ DATABASES = {
         'PORT': getenv('DB_PORT'),
     }
 }
+if DATABASES['default']['ENGINE'] == 'django.db.backends.sqlite3':
+    # Concurrency tests open a connection per thread: they need a test
+    # database in a file, not in memory, and writers waiting for the lock.
+    DATABASES['default']['OPTIONS'] = {'timeout': 20}
+    DATABASES['default']['TEST'] = {'NAME': BASE_DIR / 'test_db.sqlite3'}
+
+# Cache
+# Data set versions must be shared by the workers and the management
+# commands that bump them. The file cache is shared by the processes of
+# one host, use Redis or Memcached when running several hosts.
+
+CACHES = {
+    'default': {
+        'BACKEND': getenv(
+            'CACHE_BACKEND',
+            'django.core.cache.backends.filebased.FileBasedCache',
+        ),
+        'LOCATION': getenv('CACHE_LOCATION', str(BASE_DIR / 'cache')),
+    }
+}
+
+# Tag and ingredient catalog snapshots, set CATALOG_SNAPSHOT_ROOT to also
+# write them to disk for nginx.
+
+CATALOG_SNAPSHOT_ROOT = getenv('CATALOG_SNAPSHOT_ROOT')
+CATALOG_SNAPSHOT_MAX_AGE = int(
+    getenv('CATALOG_SNAPSHOT_MAX_AGE', 60 * 60 * 24)
+)
+
+# Recipe image limits, larger uploads are rejected.
+
+RECIPE_IMAGE_MAX_SIZE = int(getenv('RECIPE_IMAGE_MAX_SIZE', 10 * 1024 * 1024))
+RECIPE_IMAGE_MAX_PIXELS = int(getenv('RECIPE_IMAGE_MAX_PIXELS', 5000 * 5000))
+IMAGE_VARIANT_WORKERS = int(getenv('IMAGE_VARIANT_WORKERS', 2))
+
+# Maximum number of ids accepted by bulk favorite, cart and subscription
+# endpoints.
+
+BULK_IDS_LIMIT = int(getenv('BULK_IDS_LIMIT', 100))
+
+# TrueType font with Cyrillic glyphs for PDF shopping lists, the PDF
+# format is not offered when the file is missing.
+
+SHOPPING_LIST_PDF_FONT = getenv(
+    'SHOPPING_LIST_PDF_FONT', '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf'
+)
 
 # Password validation
 # https://docs.djangoproject.com/en/4.1/ref/settings/#auth-password-validators
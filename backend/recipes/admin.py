@@ -16,6 +16,8 @@ class IngredientAdmin(admin.ModelAdmin):
 class RecipeAdmin(admin.ModelAdmin):
     list_display = ('name', 'author', 'favorited_count', 'id')
     list_filter = ('name', 'author', 'tags')
+    list_select_related = ('author',)
+    readonly_fields = ('favorited_count',)
 
 
 class RecipeIngredientAdmin(admin.ModelAdmin):
@@ -28,6 +30,12 @@ class ShoppingCartAdmin(admin.ModelAdmin):
     list_filter = ('recipe', 'user')
 
 
+class ShoppingListItemAdmin(admin.ModelAdmin):
+    list_display = ('user', 'ingredient', 'amount', 'id')
+    list_filter = ('user',)
+    list_select_related = ('user', 'ingredient')
+
+
 class TagAdmin(admin.ModelAdmin):
     list_display = ('name', 'color', 'slug', 'id')
     list_filter = ('name', 'color', 'slug')
@@ -38,4 +46,5 @@ admin.site.register(models.Ingredient, IngredientAdmin)
 admin.site.register(models.Recipe, RecipeAdmin)
 admin.site.register(models.RecipeIngredient, RecipeIngredientAdmin)
 admin.site.register(models.ShoppingCart, ShoppingCartAdmin)
+admin.site.register(models.ShoppingListItem, ShoppingListItemAdmin)
 admin.site.register(models.Tag, TagAdmin)
@@ -0,0 +1,64 @@
+'''
+Denormalized counters stored on models.
+
+Counters are kept up to date with F() expressions by signal receivers;
+the functions below recompute them in bulk to repair any drift.
+'''
+
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from users.models import User
+
+from .models import Favorite, Recipe
+
+
+def change_favorited_count(recipe_ids, delta):
+    recipes = Recipe.objects.filter(pk__in=recipe_ids)
+    if delta < 0:
+        recipes = recipes.filter(favorited_count__gte=-delta)
+    return recipes.update(
+        favorited_count=F('favorited_count') + delta,
+        updated_at=timezone.now(),
+    )
+
+
+def change_recipes_count(author_ids, delta):
+    authors = User.objects.filter(pk__in=author_ids)
+    if delta < 0:
+        authors = authors.filter(recipes_count__gte=-delta)
+    return authors.update(recipes_count=F('recipes_count') + delta)
+
+
+def count_related(queryset, field):
+    return Coalesce(
+        Subquery(
+            queryset.filter(**{field: OuterRef('pk')})
+            .order_by()
+            .values(field)
+            .annotate(count=Count('id'))
+            .values('count')
+        ),
+        0,
+    )
+
+
+def recount_favorites():
+    '''
+    Recomputes Recipe.favorited_count, returns the number of fixed rows.
+    '''
+    actual = count_related(Favorite.objects.all(), 'recipe')
+    return Recipe.objects.exclude(favorited_count=actual).update(
+        favorited_count=actual, updated_at=timezone.now()
+    )
+
+
+def recount_recipes():
+    '''
+    Recomputes User.recipes_count, returns the number of fixed rows.
+    '''
+    actual = count_related(Recipe.objects.all(), 'author')
+    return User.objects.exclude(recipes_count=actual).update(
+        recipes_count=actual
+    )
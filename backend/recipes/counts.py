@@ -0,0 +1,61 @@
+'''
+Object counts for paginated responses.
+
+Small results are counted exactly, large ones are cached by the query
+signature, and on PostgreSQL very large ones fall back to the planner
+estimate.
+'''
+
+from hashlib import md5
+
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet
+from django.db import connections
+
+from .versions import get_version
+
+EXACT = 'exact'
+CACHED = 'cached'
+ESTIMATED = 'estimated'
+
+EXACT_COUNT_LIMIT = 1000
+ESTIMATE_LIMIT = 100000
+CACHE_TIMEOUT = 60 * 60
+
+
+def get_estimate(queryset):
+    sql, params = queryset.query.sql_with_params()
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+        plan = cursor.fetchone()[0]
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def get_cache_key(queryset, namespaces):
+    sql, params = queryset.query.sql_with_params()
+    signature = md5(repr((sql, params)).encode()).hexdigest()
+    return f'count:{get_version(*namespaces)}:{signature}'
+
+
+def get_count(queryset, namespaces):
+    '''
+    Returns the number of objects and the strategy used to obtain it.
+    '''
+    queryset = queryset.order_by()
+    try:
+        key = get_cache_key(queryset, namespaces)
+    except EmptyResultSet:
+        return 0, EXACT
+    count = cache.get(key)
+    if count is not None:
+        return count, CACHED
+    count = queryset[: EXACT_COUNT_LIMIT + 1].count()
+    if count <= EXACT_COUNT_LIMIT:
+        return count, EXACT
+    if connections[queryset.db].vendor == 'postgresql':
+        estimate = get_estimate(queryset)
+        if estimate > ESTIMATE_LIMIT:
+            return estimate, ESTIMATED
+    count = queryset.count()
+    cache.set(key, count, CACHE_TIMEOUT)
+    return count, EXACT
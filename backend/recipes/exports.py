@@ -0,0 +1,97 @@
+'''
+Shopping list export formats.
+
+Every format turns (name, measurement_unit, amount) rows into chunks
+of a StreamingHttpResponse body. PDF is offered only when
+SHOPPING_LIST_PDF_FONT points to a TrueType font file: the built-in
+reportlab fonts have no Cyrillic glyphs.
+'''
+
+import csv
+from io import BytesIO
+from pathlib import Path
+
+from django.conf import settings
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen.canvas import Canvas
+
+TITLE = 'Список покупок'
+
+
+def format_row(name, unit, amount):
+    return f'{name} ({unit}) - {amount}'.capitalize()
+
+
+class Echo:
+    def write(self, value):
+        return value
+
+
+class TextExport:
+    content_type = 'text/plain; charset=UTF-8'
+
+    def stream(self, rows):
+        yield f'{TITLE}:\n'
+        for row in rows:
+            yield format_row(*row) + ' \n'
+
+
+class CSVExport:
+    content_type = 'text/csv; charset=UTF-8'
+    header = ('Ингредиент', 'Единица измерения', 'Количество')
+
+    def stream(self, rows):
+        writer = csv.writer(Echo())
+        yield writer.writerow(self.header)
+        for row in rows:
+            yield writer.writerow(row)
+
+
+class PDFExport:
+    '''
+    A PDF is only readable once complete, so the document is built in
+    memory and sent as a single chunk.
+    '''
+
+    content_type = 'application/pdf'
+    font_name = 'ShoppingListFont'
+    font_size = 12
+    margin = 50
+
+    def get_font(self):
+        if self.font_name not in pdfmetrics.getRegisteredFontNames():
+            pdfmetrics.registerFont(
+                TTFont(self.font_name, settings.SHOPPING_LIST_PDF_FONT)
+            )
+        return self.font_name
+
+    def stream(self, rows):
+        buffer = BytesIO()
+        canvas = Canvas(buffer, pagesize=A4)
+        font = self.get_font()
+        _, height = A4
+        line_height = self.font_size * 1.5
+        y = height - self.margin
+        canvas.setFont(font, self.font_size + 4)
+        canvas.drawString(self.margin, y, TITLE)
+        y -= line_height * 2
+        canvas.setFont(font, self.font_size)
+        for row in rows:
+            if y < self.margin:
+                canvas.showPage()
+                canvas.setFont(font, self.font_size)
+                y = height - self.margin
+            canvas.drawString(self.margin, y, format_row(*row))
+            y -= line_height
+        canvas.save()
+        yield buffer.getvalue()
+
+
+def get_exports():
+    exports = {'txt': TextExport, 'csv': CSVExport}
+    path = settings.SHOPPING_LIST_PDF_FONT
+    if path and Path(path).is_file():
+        exports['pdf'] = PDFExport
+    return exports
@@ -1,13 +1,106 @@
-from base64 import b64decode
+import re
+from binascii import Error as DecodeError
+from binascii import a2b_base64
 
-from django.core.files.base import ContentFile
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import TemporaryUploadedFile
 from rest_framework import serializers
 
+CHUNK_SIZE = 64 * 1024
+WHITESPACE = ' \t\r\n'
+BASE64 = re.compile(r'[A-Za-z0-9+/]*')
+BASE64_END = re.compile(r'[A-Za-z0-9+/]*={0,2}')
+
+
+def decode_base64(name, content_type, data):
+    '''
+    Decodes base64 data chunk by chunk into a temporary file, so the
+    decoded image is never held in memory as a whole. Every chunk is
+    checked first: a2b_base64 silently skips characters outside the
+    alphabet.
+    '''
+    if any(char in data for char in WHITESPACE):
+        data = ''.join(data.split())
+    if len(data) % 4:
+        raise DecodeError('Incorrect padding')
+    file = TemporaryUploadedFile(name, content_type, 0, None)
+    try:
+        for start in range(0, len(data), CHUNK_SIZE):
+            end = start + CHUNK_SIZE
+            chunk = data[start:end]
+            pattern = BASE64_END if end >= len(data) else BASE64
+            if not pattern.fullmatch(chunk):
+                raise DecodeError('Invalid base64 data')
+            file.write(a2b_base64(chunk))
+    except DecodeError:
+        file.close()
+        raise
+    file.size = file.tell()
+    file.seek(0)
+    return file
+
 
 class Base64ImageField(serializers.ImageField):
+    '''
+    Image field accepting either an uploaded file or a base64 data URI.
+    Payloads larger than RECIPE_IMAGE_MAX_SIZE bytes are rejected before
+    decoding, images larger than RECIPE_IMAGE_MAX_PIXELS before saving.
+    Decoded data URIs are kept in temporary files until close_files().
+    '''
+
+    default_error_messages = {
+        'max_size': 'Размер изображения больше {max_size} байт.',
+        'max_pixels': 'Изображение больше {max_pixels} пикселей.',
+        'invalid_base64': 'Изображение должно быть в кодировке base64.',
+    }
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.decoded_files = []
+
+    def close_files(self):
+        '''
+        The storage may have moved a file already, close() allows that.
+        '''
+        while self.decoded_files:
+            self.decoded_files.pop().close()
+
     def to_internal_value(self, data):
+        max_size = settings.RECIPE_IMAGE_MAX_SIZE
         if isinstance(data, str) and data.startswith('data:image'):
-            format, imgstr = data.split(';base64,')
+            format, _, imgstr = data.partition(';base64,')
+            if len(imgstr) // 4 * 3 > max_size:
+                self.fail('max_size', max_size=max_size)
             ext = format.split('/')[-1]
-            data = ContentFile(b64decode(imgstr), name='image.' + ext)
-        return super().to_internal_value(data)
+            try:
+                data = decode_base64('image.' + ext, format[5:], imgstr)
+            except DecodeError:
+                self.fail('invalid_base64')
+            self.decoded_files.append(data)
+        elif getattr(data, 'size', 0) > max_size:
+            self.fail('max_size', max_size=max_size)
+        image = super().to_internal_value(data)
+        max_pixels = settings.RECIPE_IMAGE_MAX_PIXELS
+        width, height = image.image.size
+        if width * height > max_pixels:
+            self.fail('max_pixels', max_pixels=max_pixels)
+        return image
+
+
+class ImageVariantsField(serializers.ReadOnlyField):
+    '''
+    Represents Recipe.image_variants as {size: {format: url}}.
+    '''
+
+    def to_representation(self, variants):
+        request = self.context.get('request')
+        urls = {}
+        for size, formats in variants.items():
+            urls[size] = {}
+            for format, name in formats.items():
+                url = default_storage.url(name)
+                if request is not None:
+                    url = request.build_absolute_uri(url)
+                urls[size][format] = url
+        return urls
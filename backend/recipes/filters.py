@@ -1,15 +1,45 @@
-from django_filters import FilterSet, ModelMultipleChoiceFilter
-
-from .models import Recipe, Tag
-
-
-class RecipeFilter(FilterSet):
-    tags = ModelMultipleChoiceFilter(
-        field_name='tags__slug',
-        to_field_name='slug',
-        queryset=Tag.objects.all(),
-    )
-
-    class Meta:
-        model = Recipe
-        fields = ('author',)
+from django.db.models import Exists, OuterRef
+from django_filters import FilterSet, ModelMultipleChoiceFilter, OrderingFilter
+
+from .models import Recipe, Tag
+
+
+class RecipeOrderingFilter(OrderingFilter):
+    '''
+    Adds the id tiebreaker so that pages stay stable for equal values.
+    '''
+
+    def filter(self, qs, value):
+        qs = super().filter(qs, value)
+        if value:
+            return qs.order_by(*qs.query.order_by, '-id')
+        return qs
+
+
+class RecipeFilter(FilterSet):
+    tags = ModelMultipleChoiceFilter(
+        field_name='tags__slug',
+        to_field_name='slug',
+        queryset=Tag.objects.all(),
+        method='filter_tags',
+    )
+    ordering = RecipeOrderingFilter(fields=('pub_date', 'favorited_count'))
+
+    class Meta:
+        model = Recipe
+        fields = ('author',)
+
+    def filter_tags(self, queryset, name, tags):
+        '''
+        Semi-join on the recipe-tag table instead of joining it, so a
+        recipe matching several tags is returned once without DISTINCT.
+        '''
+        if not tags:
+            return queryset
+        return queryset.filter(
+            Exists(
+                Recipe.tags.through.objects.filter(
+                    recipe=OuterRef('pk'), tag__in=tags
+                )
+            )
+        )
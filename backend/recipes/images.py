@@ -0,0 +1,97 @@
+'''
+Resized variants of recipe images.
+
+Variants are generated in a thread pool after the transaction that saved
+the image commits, stored next to the original and recorded in
+Recipe.image_variants as {size: {format: path}}.
+'''
+
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from pathlib import PurePosixPath
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from .models import Recipe
+from .versions import RECIPES, bump_version
+
+logger = logging.getLogger(__name__)
+
+VARIANT_WIDTHS = {'small': 320, 'medium': 640}
+VARIANT_FORMATS = {'webp': 'WEBP', 'jpeg': 'JPEG'}
+VARIANT_QUALITY = 80
+
+executor = ThreadPoolExecutor(
+    max_workers=settings.IMAGE_VARIANT_WORKERS,
+    thread_name_prefix='image-variants',
+)
+
+
+def render_variants(name):
+    '''
+    Saves every variant of the image to the storage and returns their paths.
+    Variants already stored for the same file are reused.
+    '''
+    path = PurePosixPath(name)
+    variants = {
+        size: {
+            extension: str(
+                path.parent / 'variants' / f'{path.stem}_{size}.{extension}'
+            )
+            for extension in VARIANT_FORMATS
+        }
+        for size in VARIANT_WIDTHS
+    }
+    image = None
+    for size, width in VARIANT_WIDTHS.items():
+        for extension, format in VARIANT_FORMATS.items():
+            variant_name = variants[size][extension]
+            if default_storage.exists(variant_name):
+                continue
+            if image is None:
+                with default_storage.open(name) as file:
+                    image = ImageOps.exif_transpose(Image.open(file))
+                    image = image.convert('RGB')
+            variant = image.copy()
+            variant.thumbnail((width, width * 4))
+            buffer = BytesIO()
+            variant.save(buffer, format, quality=VARIANT_QUALITY)
+            variants[size][extension] = default_storage.save(
+                variant_name, ContentFile(buffer.getvalue())
+            )
+    return variants
+
+
+def generate_variants(recipe_id, path):
+    '''
+    Stores the variants unless the recipe image changed in the meantime.
+    '''
+    variants = render_variants(path)
+    updated = Recipe.objects.filter(id=recipe_id, image=path).update(
+        image_variants=variants, updated_at=timezone.now()
+    )
+    if updated:
+        bump_version(RECIPES)
+    return variants
+
+
+def generate_variants_in_worker(recipe_id, path):
+    try:
+        generate_variants(recipe_id, path)
+    except Exception:
+        logger.exception('Image variants of recipe %s failed', recipe_id)
+    finally:
+        connection.close()
+
+
+def schedule_variants(recipe):
+    path = recipe.image.name
+    transaction.on_commit(
+        lambda: executor.submit(generate_variants_in_worker, recipe.id, path)
+    )
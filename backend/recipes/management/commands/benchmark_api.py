@@ -0,0 +1,256 @@
+'''
+Скрипт для замера производительности основных эндпоинтов API.
+'''
+
+import json
+import platform
+import statistics
+import tracemalloc
+from datetime import datetime, timezone
+from io import StringIO
+from time import perf_counter
+
+import django
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Count
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from recipes.models import Recipe, Tag
+from users.models import User
+
+SIZES = (1000, 10000)
+PAGE_SIZES = (6, 50)
+REPEAT = 20
+WARMUP = 2
+PERCENTILES = (50, 90, 95, 99)
+USERS_PREFIX = 'benchmark'
+INGREDIENT_QUERY = 'сок'
+RECIPES_LIMIT = 3
+BENCHMARK_SETTINGS = {
+    'ALLOWED_HOSTS': ['testserver'],
+    'CACHES': {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'benchmark',
+        }
+    },
+    'CATALOG_SNAPSHOT_ROOT': None,
+}
+
+
+def get_scenarios(page_size):
+    '''
+    Yields (name, url, authenticated) of every measured request.
+    '''
+    recipes = reverse('recipes:recipe-list')
+    recipe = (
+        Recipe.objects.order_by('-favorited_count', '-id')
+        .values_list('id', flat=True)
+        .first()
+    )
+    yield 'recipes', f'{recipes}?limit={page_size}', False
+    yield 'recipes_auth', f'{recipes}?limit={page_size}', True
+    slugs = list(Tag.objects.order_by('id').values_list('slug', flat=True))
+    for count in range(1, min(len(slugs), 5) + 1):
+        tags = '&'.join(f'tags={slug}' for slug in slugs[:count])
+        yield (
+            f'recipes_tags_{count}',
+            f'{recipes}?limit={page_size}&{tags}',
+            True,
+        )
+    yield 'recipe', reverse('recipes:recipe-detail', args=(recipe,)), True
+    yield (
+        'subscriptions',
+        f"{reverse('users:user-subscriptions')}?limit={page_size}"
+        f'&recipes_limit={RECIPES_LIMIT}',
+        True,
+    )
+    yield (
+        'ingredients_search',
+        f"{reverse('recipes:ingredient-list')}?name={INGREDIENT_QUERY}",
+        False,
+    )
+    yield (
+        'download_shopping_cart',
+        reverse('recipes:recipe-download-shopping-cart'),
+        True,
+    )
+
+
+def get_user():
+    '''
+    The user with the largest shopping cart and most subscriptions, the
+    worst case for the personal endpoints.
+    '''
+    return (
+        User.objects.annotate(
+            carts=Count('user_cart', distinct=True),
+            subscriptions=Count('subscribers', distinct=True),
+        )
+        .order_by('-carts', '-subscriptions', 'id')
+        .first()
+    )
+
+
+def request(client, url):
+    response = client.get(url)
+    if response.streaming:
+        content = b''.join(response.streaming_content)
+    else:
+        content = response.content
+    return response.status_code, len(content)
+
+
+def get_latency(timings):
+    timings = sorted(timings)
+    latency = {
+        'min': timings[0],
+        'mean': statistics.fmean(timings),
+        'max': timings[-1],
+    }
+    if len(timings) > 1:
+        quantiles = statistics.quantiles(timings, n=100, method='inclusive')
+        for percentile in PERCENTILES:
+            latency[f'p{percentile}'] = quantiles[percentile - 1]
+    return {key: round(value * 1000, 3) for key, value in latency.items()}
+
+
+def measure(client, url, repeat, warm_cache):
+    for _ in range(WARMUP):
+        request(client, url)
+    timings = []
+    queries = 0
+    for _ in range(repeat):
+        if not warm_cache:
+            cache.clear()
+        with CaptureQueriesContext(connection) as context:
+            started = perf_counter()
+            status, size = request(client, url)
+            timings.append(perf_counter() - started)
+        queries = max(queries, len(context.captured_queries))
+    if not warm_cache:
+        cache.clear()
+    tracemalloc.start()
+    try:
+        request(client, url)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        'status': status,
+        'bytes': size,
+        'queries': queries,
+        'latency_ms': get_latency(timings),
+        'peak_memory_kb': round(peak / 1024, 1),
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        'Замер времени ответа, числа запросов к БД и пикового потребления '
+        'памяти основными эндпоинтами на сгенерированных данных. '
+        'Данные создаются в транзакции, которая затем откатывается'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes',
+            type=int,
+            nargs='+',
+            default=SIZES,
+            help='Число рецептов в наборах данных',
+        )
+        parser.add_argument(
+            '--page-sizes',
+            type=int,
+            nargs='+',
+            default=PAGE_SIZES,
+            help='Размеры страниц списков',
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=REPEAT,
+            help='Число замеров каждого запроса',
+        )
+        parser.add_argument(
+            '--seed', type=int, default=0, help='Начальное значение ГПСЧ'
+        )
+        parser.add_argument(
+            '--warm-cache',
+            action='store_true',
+            help='Не очищать кеш перед каждым запросом',
+        )
+        parser.add_argument(
+            '--output', help='Путь к JSON-отчёту, по умолчанию stdout'
+        )
+
+    def run_dataset(self, size, options):
+        call_command(
+            'generate_dataset',
+            recipes=size,
+            seed=options['seed'],
+            prefix=USERS_PREFIX,
+            verbosity=0,
+            stdout=StringIO(),
+        )
+        user = get_user()
+        token = Token.objects.create(user=user)
+        clients = {False: APIClient(), True: APIClient()}
+        clients[True].credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        results = []
+        for page_size in options['page_sizes']:
+            for name, url, authenticated in get_scenarios(page_size):
+                result = {
+                    'dataset': size,
+                    'page_size': page_size,
+                    'scenario': name,
+                    'url': url,
+                    **measure(
+                        clients[authenticated],
+                        url,
+                        options['repeat'],
+                        options['warm_cache'],
+                    ),
+                }
+                results.append(result)
+                latency = result['latency_ms']
+                self.stderr.write(
+                    f'{size:>8} {page_size:>4} {name:<24} '
+                    f"{result['status']} {result['queries']:>3} запр. "
+                    f"p50 {latency.get('p50', latency['min']):>9.2f} мс "
+                    f"max {latency['max']:>9.2f} мс "
+                    f"{result['peak_memory_kb']:>9.1f} КБ"
+                )
+        return results
+
+    def handle(self, *args, **options):
+        results = []
+        with override_settings(**BENCHMARK_SETTINGS):
+            for size in options['sizes']:
+                with transaction.atomic():
+                    results.extend(self.run_dataset(size, options))
+                    transaction.set_rollback(True)
+                cache.clear()
+        report = {
+            'created_at': datetime.now(timezone.utc).isoformat(),
+            'database': connection.vendor,
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'seed': options['seed'],
+            'repeat': options['repeat'],
+            'warm_cache': options['warm_cache'],
+            'results': results,
+        }
+        content = json.dumps(report, ensure_ascii=False, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                file.write(content + '\n')
+        else:
+            self.stdout.write(content)
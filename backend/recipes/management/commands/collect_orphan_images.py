@@ -0,0 +1,118 @@
+'''
+Скрипт для удаления картинок рецептов, на которые нет ссылок.
+'''
+
+import os
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+from time import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from recipes.models import Recipe
+
+
+def scan_directory(directory):
+    files, directories = [], []
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                directories.append(entry.path)
+            elif entry.is_file(follow_symlinks=False):
+                stat = entry.stat(follow_symlinks=False)
+                files.append((entry.path, stat.st_mtime, stat.st_size))
+    return files, directories
+
+
+def walk(executor, root):
+    '''
+    Yields (path, mtime, size) of every file below root, directories are
+    scanned in parallel.
+    '''
+    pending = {executor.submit(scan_directory, root)}
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            files, directories = future.result()
+            yield from files
+            pending |= {
+                executor.submit(scan_directory, directory)
+                for directory in directories
+            }
+
+
+def remove_file(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def get_referenced_names():
+    names = set()
+    recipes = Recipe.objects.values_list('image', 'image_variants')
+    for image, variants in recipes.iterator():
+        names.add(image)
+        for formats in variants.values():
+            names.update(formats.values())
+    return names
+
+
+class Command(BaseCommand):
+    help = 'Удаление картинок рецептов, на которые не ссылается ни один рецепт'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только показать файлы, ничего не удаляя',
+        )
+        parser.add_argument(
+            '--older-than',
+            type=int,
+            default=24,
+            help='Удалять только файлы старше указанного числа часов',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=8,
+            help='Число потоков для обхода каталогов',
+        )
+
+    def handle(self, *args, **options):
+        media_root = Path(settings.MEDIA_ROOT)
+        field = Recipe._meta.get_field('image')
+        root = media_root / field.upload_to
+        if not root.is_dir():
+            self.stdout.write(f'Каталог {root} не найден')
+            return
+        referenced = get_referenced_names()
+        deadline = time() - options['older_than'] * 60 * 60
+        with ThreadPoolExecutor(options['workers']) as executor:
+            orphans = {
+                Path(path).relative_to(media_root).as_posix(): file_size
+                for path, mtime, file_size in walk(executor, root)
+                if mtime < deadline
+            }
+            for name in referenced & orphans.keys():
+                del orphans[name]
+            # Uploads identical to an orphan reuse it, look for them again.
+            for name in Recipe.objects.filter(
+                image__in=list(orphans)
+            ).values_list('image', flat=True):
+                orphans.pop(name, None)
+            if options['verbosity'] > 1:
+                for name in sorted(orphans):
+                    self.stdout.write(name)
+            if not options['dry_run']:
+                list(
+                    executor.map(
+                        remove_file, (media_root / name for name in orphans)
+                    )
+                )
+        action = 'Найдено' if options['dry_run'] else 'Удалено'
+        self.stdout.write(
+            f'{action} файлов: {len(orphans)}, байт: {sum(orphans.values())}'
+        )
@@ -0,0 +1,163 @@
+'''
+Скрипт для выгрузки пользователей, рецептов и связей между ними в NDJSON.
+'''
+
+import json
+from datetime import datetime
+
+from django.core.management.base import BaseCommand
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Prefetch
+
+from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
+                            ShoppingCart, Tag)
+from users.models import Subscription, User
+
+BATCH_SIZE = 2000
+
+USER_FIELDS = (
+    'id',
+    'username',
+    'email',
+    'first_name',
+    'last_name',
+    'password',
+    'is_active',
+    'is_staff',
+    'is_superuser',
+    'date_joined',
+    'last_login',
+)
+RECIPE_FIELDS = (
+    'id',
+    'author',
+    'name',
+    'image',
+    'image_variants',
+    'text',
+    'cooking_time',
+    'pub_date',
+    'updated_at',
+)
+
+
+class Encoder(DjangoJSONEncoder):
+    '''
+    Keeps the microseconds DjangoJSONEncoder drops from datetimes.
+    '''
+
+    def default(self, o):
+        if isinstance(o, datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+def get_rows(queryset, fields):
+    return queryset.values(*fields).iterator(chunk_size=BATCH_SIZE)
+
+
+def get_recipes():
+    recipes = (
+        Recipe.objects.only(*RECIPE_FIELDS)
+        .order_by('id')
+        .prefetch_related(
+            Prefetch('tags', queryset=Tag.objects.only('slug')),
+            Prefetch(
+                'recipe_ingredients',
+                queryset=RecipeIngredient.objects.select_related('ingredient'),
+            ),
+        )
+    )
+    for recipe in recipes.iterator(chunk_size=BATCH_SIZE):
+        yield {
+            'id': recipe.id,
+            'author': recipe.author_id,
+            'name': recipe.name,
+            'image': recipe.image.name,
+            'image_variants': recipe.image_variants,
+            'text': recipe.text,
+            'cooking_time': recipe.cooking_time,
+            'pub_date': recipe.pub_date,
+            'updated_at': recipe.updated_at,
+            'tags': [tag.slug for tag in recipe.tags.all()],
+            'ingredients': [
+                [
+                    item.ingredient.name,
+                    item.ingredient.measurement_unit,
+                    item.amount,
+                ]
+                for item in recipe.recipe_ingredients.all()
+            ],
+        }
+
+
+def get_sections():
+    '''
+    Sections in the order the import needs them: every row refers only
+    to rows of the sections before it.
+    '''
+    return (
+        (
+            'tag',
+            get_rows(Tag.objects.order_by('id'), ('name', 'color', 'slug')),
+        ),
+        (
+            'ingredient',
+            get_rows(
+                Ingredient.objects.order_by('id'), ('name', 'measurement_unit')
+            ),
+        ),
+        ('user', get_rows(User.objects.order_by('id'), USER_FIELDS)),
+        ('recipe', get_recipes()),
+        (
+            'subscription',
+            get_rows(Subscription.objects.order_by('id'), ('user', 'author')),
+        ),
+        (
+            'favorite',
+            get_rows(Favorite.objects.order_by('id'), ('user', 'recipe')),
+        ),
+        (
+            'shopping_cart',
+            get_rows(ShoppingCart.objects.order_by('id'), ('user', 'recipe')),
+        ),
+    )
+
+
+class Command(BaseCommand):
+    help = (
+        'Выгрузка тегов, ингредиентов, пользователей, рецептов, подписок, '
+        'избранного и корзин в NDJSON-файл'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'filepath', help='Путь к файлу или "-" для вывода в stdout'
+        )
+
+    def handle(self, *args, **options):
+        if options['filepath'] == '-':
+            file, write, log = None, self.stdout.write, self.stderr
+        else:
+            file = open(options['filepath'], 'w', encoding='utf-8')
+            write, log = (lambda line: file.write(line + '\n')), self.stdout
+        counts = {}
+        try:
+            for kind, rows in get_sections():
+                counts[kind] = 0
+                for row in rows:
+                    write(
+                        json.dumps(
+                            {'type': kind, **row},
+                            ensure_ascii=False,
+                            cls=Encoder,
+                        )
+                    )
+                    counts[kind] += 1
+        finally:
+            if file is not None:
+                file.close()
+        log.write(
+            'Выгружено: '
+            + ', '.join(f'{kind} {count}' for kind, count in counts.items())
+        )
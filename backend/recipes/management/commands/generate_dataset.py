@@ -0,0 +1,325 @@
+'''
+Скрипт для генерации тестовых данных для нагрузочного тестирования.
+'''
+
+import random
+from array import array
+from io import StringIO
+from itertools import accumulate, islice
+from time import monotonic
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from recipes.counters import recount_favorites, recount_recipes
+from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
+                            ShoppingCart, Tag)
+from recipes.snapshots import remove_snapshot_files
+from recipes.versions import (FAVORITES, INGREDIENTS, RECIPES, SHOPPING_CART,
+                              SUBSCRIPTIONS, TAGS, USERS, bump_version)
+from users.models import Subscription, User
+
+BATCH_SIZE = 5000
+INGREDIENTS_PATH = settings.BASE_DIR.parent / 'data' / 'ingredients.csv'
+PASSWORD = 'Qwerty!2'
+TAGS_DATA = (
+    ('Завтрак', '#E26C2D', 'breakfast'),
+    ('Обед', '#49B64E', 'lunch'),
+    ('Ужин', '#8775D2', 'dinner'),
+    ('Десерт', '#F5A623', 'dessert'),
+    ('Выпечка', '#B8860B', 'baking'),
+    ('Салат', '#7ED321', 'salad'),
+    ('Суп', '#D0021B', 'soup'),
+    ('Напиток', '#4A90E2', 'drink'),
+)
+
+
+def zipf_weights(count, exponent):
+    '''
+    Cumulative weights of ranks 1..count, rank r drawn with probability
+    proportional to 1 / r ** exponent.
+    '''
+    return array(
+        'd',
+        accumulate(1 / rank**exponent for rank in range(1, count + 1)),
+    )
+
+
+class Sampler:
+    '''
+    Draws items of a sequence with Zipf-distributed popularity: the first
+    items are picked far more often than the last ones.
+    '''
+
+    def __init__(self, rng, items, exponent):
+        self.rng = rng
+        self.items = items
+        self.weights = zipf_weights(len(items), exponent)
+
+    def sample(self, count):
+        '''
+        Returns up to count distinct items.
+        '''
+        if not count or not self.items:
+            return []
+        indexes = self.rng.choices(
+            range(len(self.items)), cum_weights=self.weights, k=count
+        )
+        return [self.items[index] for index in dict.fromkeys(indexes)]
+
+
+class Command(BaseCommand):
+    help = (
+        'Генерация пользователей, рецептов, подписок, избранного и корзин '
+        'с распределением Ципфа для нагрузочного тестирования'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--recipes', type=int, default=1000, help='Число рецептов'
+        )
+        parser.add_argument(
+            '--users',
+            type=int,
+            help='Число пользователей, по умолчанию пятая часть рецептов',
+        )
+        parser.add_argument(
+            '--favorites',
+            type=int,
+            default=10,
+            help='Среднее число рецептов в избранном пользователя',
+        )
+        parser.add_argument(
+            '--carts',
+            type=int,
+            default=3,
+            help='Среднее число рецептов в корзине пользователя',
+        )
+        parser.add_argument(
+            '--subscriptions',
+            type=int,
+            default=5,
+            help='Среднее число подписок пользователя',
+        )
+        parser.add_argument(
+            '--zipf',
+            type=float,
+            default=1.1,
+            help='Показатель распределения Ципфа, 0 - равномерное',
+        )
+        parser.add_argument(
+            '--seed', type=int, default=0, help='Начальное значение ГПСЧ'
+        )
+        parser.add_argument(
+            '--prefix',
+            default='dataset',
+            help='Префикс имён создаваемых пользователей',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=BATCH_SIZE,
+            help='Число записей, добавляемых одним запросом',
+        )
+
+    def log(self, message):
+        if self.verbosity > 0:
+            elapsed = monotonic() - self.started
+            self.stdout.write(f'[{elapsed:7.1f} с] {message}')
+
+    def bulk_create(self, model, objects, return_ids=False, **kwargs):
+        '''
+        Inserts objects produced by a generator batch by batch. Returns the
+        ids of the created rows if asked, their number otherwise.
+        '''
+        ids = array('q')
+        count = 0
+        objects = iter(objects)
+        while batch := list(islice(objects, self.batch_size)):
+            created = model.objects.bulk_create(batch, **kwargs)
+            if return_ids:
+                ids.extend(instance.pk for instance in created)
+            count += len(batch)
+        self.log(f'{model._meta.object_name}: {count}')
+        return ids if return_ids else count
+
+    def validate(self, options, users_count):
+        if options['recipes'] < 0:
+            raise CommandError('--recipes не может быть отрицательным')
+        if users_count < 1:
+            raise CommandError('Нужен хотя бы один пользователь')
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size должен быть больше нуля')
+        if options['zipf'] < 0:
+            raise CommandError('--zipf не может быть отрицательным')
+        for name in ('favorites', 'carts', 'subscriptions'):
+            if options[name] < 0:
+                raise CommandError(f'--{name} не может быть отрицательным')
+        if not options['recipes'] and (
+            options['favorites'] or options['carts']
+        ):
+            raise CommandError(
+                'Для избранного и корзин нужен хотя бы один рецепт'
+            )
+
+    def get_count(self, mean):
+        '''
+        Per-user number of relations, averaging mean.
+        '''
+        return round(self.rng.expovariate(1 / mean)) if mean > 0 else 0
+
+    def create_catalog(self):
+        if not Ingredient.objects.exists():
+            call_command(
+                'load_ingredients',
+                str(INGREDIENTS_PATH),
+                verbosity=0,
+                stdout=StringIO(),
+            )
+        Tag.objects.bulk_create(
+            [
+                Tag(name=name, color=color, slug=slug)
+                for name, color, slug in TAGS_DATA
+            ],
+            ignore_conflicts=True,
+        )
+        tags = list(Tag.objects.order_by('id').values_list('id', flat=True))
+        ingredients = array(
+            'q', Ingredient.objects.order_by('id').values_list('id', flat=True)
+        )
+        if not ingredients:
+            raise CommandError('Список ингредиентов пуст')
+        return tags, ingredients
+
+    def create_users(self, count, prefix):
+        password = make_password(PASSWORD)
+        return self.bulk_create(
+            User,
+            (
+                User(
+                    username=f'{prefix}{number}',
+                    email=f'{prefix}{number}@example.com',
+                    first_name='Пользователь',
+                    last_name=str(number),
+                    password=password,
+                )
+                for number in range(count)
+            ),
+            return_ids=True,
+        )
+
+    def create_recipes(self, count, authors):
+        return self.bulk_create(
+            Recipe,
+            (
+                Recipe(
+                    author_id=authors.sample(1)[0],
+                    name=f'Рецепт {number}',
+                    image='recipes/images/dataset.png',
+                    text=f'Описание рецепта {number}',
+                    cooking_time=self.rng.randint(5, 180),
+                )
+                for number in range(count)
+            ),
+            return_ids=True,
+        )
+
+    def create_recipe_relations(self, recipes, tags, ingredients):
+        self.bulk_create(
+            Recipe.tags.through,
+            (
+                Recipe.tags.through(recipe_id=recipe_id, tag_id=tag_id)
+                for recipe_id in recipes
+                for tag_id in tags.sample(self.rng.randint(1, 3))
+            ),
+        )
+        self.bulk_create(
+            RecipeIngredient,
+            (
+                RecipeIngredient(
+                    recipe_id=recipe_id,
+                    ingredient_id=ingredient_id,
+                    amount=self.rng.randint(1, 500),
+                )
+                for recipe_id in recipes
+                for ingredient_id in ingredients.sample(
+                    self.rng.randint(3, 12)
+                )
+            ),
+        )
+
+    def create_user_relations(self, model, field, users, targets, mean):
+        self.bulk_create(
+            model,
+            (
+                model(user_id=user_id, **{field: target_id})
+                for user_id in users
+                for target_id in targets.sample(self.get_count(mean))
+                if model is not Subscription or target_id != user_id
+            ),
+            ignore_conflicts=True,
+        )
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.verbosity = options['verbosity']
+        self.batch_size = options['batch_size']
+        self.started = monotonic()
+        recipes_count = options['recipes']
+        users_count = options['users']
+        if users_count is None:
+            users_count = max(recipes_count // 5, 1)
+        self.validate(options, users_count)
+        prefix = options['prefix']
+        if User.objects.filter(username__startswith=prefix).exists():
+            raise CommandError(
+                f'Пользователи с префиксом "{prefix}" уже существуют, '
+                'укажите другой --prefix'
+            )
+        exponent = options['zipf']
+        with transaction.atomic():
+            tags, ingredients = self.create_catalog()
+            users = self.create_users(users_count, prefix)
+            authors = Sampler(self.rng, users, exponent)
+            recipes = self.create_recipes(recipes_count, authors)
+            self.create_recipe_relations(
+                recipes,
+                Sampler(self.rng, tags, exponent),
+                Sampler(self.rng, ingredients, exponent),
+            )
+            popular = Sampler(self.rng, recipes, exponent)
+            self.create_user_relations(
+                Subscription,
+                'author_id',
+                users,
+                authors,
+                options['subscriptions'],
+            )
+            self.create_user_relations(
+                Favorite, 'recipe_id', users, popular, options['favorites']
+            )
+            self.create_user_relations(
+                ShoppingCart, 'recipe_id', users, popular, options['carts']
+            )
+            recount_favorites()
+            recount_recipes()
+            call_command('rebuild_shopping_lists', stdout=StringIO())
+            self.log('счётчики и списки покупок пересчитаны')
+        bump_version(
+            FAVORITES,
+            INGREDIENTS,
+            RECIPES,
+            SHOPPING_CART,
+            SUBSCRIPTIONS,
+            TAGS,
+            USERS,
+        )
+        remove_snapshot_files('tag')
+        remove_snapshot_files('ingredient')
+        self.stdout.write(
+            f'Создано пользователей: {len(users)}, рецептов: {len(recipes)} '
+            f'за {monotonic() - self.started:.1f} с'
+        )
@@ -0,0 +1,33 @@
+'''
+Скрипт для создания уменьшенных картинок рецептов.
+'''
+
+from django.core.management.base import BaseCommand
+
+from recipes.images import generate_variants
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = 'Создание уменьшенных картинок для рецептов без них'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Пересоздать картинки для всех рецептов',
+        )
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.exclude(image='')
+        if not options['all']:
+            recipes = recipes.filter(image_variants={})
+        count = 0
+        for recipe_id, image in recipes.values_list('id', 'image').iterator():
+            try:
+                generate_variants(recipe_id, image)
+            except OSError as error:
+                self.stderr.write(f'{recipe_id}: {error}')
+                continue
+            count += 1
+        self.stdout.write(f'Обработано рецептов: {count}')
@@ -0,0 +1,313 @@
+'''
+Скрипт для загрузки пользователей, рецептов и связей между ними из NDJSON.
+'''
+
+import json
+from itertools import groupby, islice
+from pathlib import Path
+from time import monotonic
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from recipes.counters import recount_favorites, recount_recipes
+from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
+                            ShoppingCart, Tag)
+from recipes.shopping_lists import refresh_shopping_lists
+from recipes.snapshots import remove_snapshot_files
+from recipes.versions import (FAVORITES, INGREDIENTS, RECIPES, SHOPPING_CART,
+                              SUBSCRIPTIONS, TAGS, USERS, bump_version,
+                              user_namespace)
+from users.models import Subscription, User
+
+BATCH_SIZE = 2000
+
+USER_FIELDS = (
+    'username',
+    'email',
+    'first_name',
+    'last_name',
+    'password',
+    'is_active',
+    'is_staff',
+    'is_superuser',
+    'date_joined',
+    'last_login',
+)
+RECIPE_FIELDS = ('name', 'image', 'image_variants', 'text', 'cooking_time')
+USER_NAMESPACES = (FAVORITES, SHOPPING_CART, SUBSCRIPTIONS)
+
+
+def read_rows(file):
+    for number, line in enumerate(file, 1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+            row['type']
+        except (ValueError, KeyError, TypeError):
+            raise CommandError(f'Строка {number}: некорректная запись')
+        yield row
+
+
+def batched(rows, size):
+    rows = iter(rows)
+    while batch := list(islice(rows, size)):
+        yield batch
+
+
+class Importer:
+    '''
+    Inserts rows batch by batch. Users and recipes get new ids, the
+    ids of the file are remapped through the users and recipes dicts;
+    tags and ingredients are matched by their natural keys. Users with
+    an existing username are reused, not created; recipes have no natural
+    key, so importing a file twice duplicates them. Rows already in the
+    database are skipped, self.created counts only the inserted ones.
+    '''
+
+    def __init__(self):
+        self.users = {}
+        self.recipes = {}
+        self.tags = {}
+        self.cart_user_ids = set()
+        self.created = {}
+        self.handlers = {
+            'tag': self.import_tag,
+            'ingredient': self.import_ingredient,
+            'user': self.import_user,
+            'recipe': self.import_recipe,
+            'subscription': self.import_subscription,
+            'favorite': self.import_favorite,
+            'shopping_cart': self.import_shopping_cart,
+        }
+
+    def count(self, kind, created):
+        self.created[kind] = self.created.get(kind, 0) + created
+
+    def import_tag(self, rows):
+        existing = set(
+            Tag.objects.filter(
+                slug__in=[row['slug'] for row in rows]
+            ).values_list('slug', flat=True)
+        )
+        new = {row['slug']: row for row in rows if row['slug'] not in existing}
+        Tag.objects.bulk_create(
+            [
+                Tag(name=row['name'], color=row['color'], slug=slug)
+                for slug, row in new.items()
+            ],
+            ignore_conflicts=True,
+        )
+        self.count('tag', len(new))
+
+    def import_ingredient(self, rows):
+        keys = dict.fromkeys(
+            (row['name'], row['measurement_unit']) for row in rows
+        )
+        existing = set(
+            Ingredient.objects.filter(
+                name__in={name for name, _ in keys}
+            ).values_list('name', 'measurement_unit')
+        )
+        new = [key for key in keys if key not in existing]
+        Ingredient.objects.bulk_create(
+            [
+                Ingredient(name=name, measurement_unit=measurement_unit)
+                for name, measurement_unit in new
+            ],
+            ignore_conflicts=True,
+        )
+        self.count('ingredient', len(new))
+
+    def import_user(self, rows):
+        existing = dict(
+            User.objects.filter(
+                username__in=[row['username'] for row in rows]
+            ).values_list('username', 'id')
+        )
+        new = []
+        for row in rows:
+            if row['username'] in existing:
+                self.users[row['id']] = existing[row['username']]
+            else:
+                new.append(row)
+        users = User.objects.bulk_create(
+            [
+                User(**{field: row[field] for field in USER_FIELDS})
+                for row in new
+            ]
+        )
+        for row, user in zip(new, users):
+            self.users[row['id']] = user.id
+        self.count('user', len(users))
+
+    def get_ingredients(self, rows):
+        names = {name for row in rows for name, _, _ in row['ingredients']}
+        return {
+            (name, measurement_unit): id
+            for id, name, measurement_unit in Ingredient.objects.filter(
+                name__in=names
+            ).values_list('id', 'name', 'measurement_unit')
+        }
+
+    def import_recipe(self, rows):
+        if not self.tags:
+            self.tags = dict(Tag.objects.values_list('slug', 'id'))
+        rows = [row for row in rows if row['author'] in self.users]
+        recipes = Recipe.objects.bulk_create(
+            [
+                Recipe(
+                    author_id=self.users[row['author']],
+                    **{field: row[field] for field in RECIPE_FIELDS},
+                )
+                for row in rows
+            ]
+        )
+        # pub_date and updated_at are overwritten on insert.
+        for row, recipe in zip(rows, recipes):
+            recipe.pub_date = row['pub_date']
+            recipe.updated_at = row['updated_at']
+            self.recipes[row['id']] = recipe.id
+        Recipe.objects.bulk_update(recipes, ['pub_date', 'updated_at'])
+        Recipe.tags.through.objects.bulk_create(
+            Recipe.tags.through(recipe_id=recipe.id, tag_id=self.tags[slug])
+            for row, recipe in zip(rows, recipes)
+            for slug in row['tags']
+            if slug in self.tags
+        )
+        ingredients = self.get_ingredients(rows)
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(
+                recipe_id=recipe.id,
+                ingredient_id=ingredients[name, measurement_unit],
+                amount=amount,
+            )
+            for row, recipe in zip(rows, recipes)
+            for name, measurement_unit, amount in row['ingredients']
+            if (name, measurement_unit) in ingredients
+        )
+        self.count('recipe', len(recipes))
+
+    def import_relations(self, kind, model, key, targets, rows):
+        pairs = dict.fromkeys(
+            (self.users[row['user']], targets[row[key]])
+            for row in rows
+            if row['user'] in self.users and row[key] in targets
+        )
+        existing = set(
+            model.objects.filter(
+                user_id__in={user_id for user_id, _ in pairs},
+                **{f'{key}_id__in': {target_id for _, target_id in pairs}},
+            ).values_list('user_id', f'{key}_id')
+        )
+        objects = [
+            model(user_id=user_id, **{f'{key}_id': target_id})
+            for user_id, target_id in pairs
+            if (user_id, target_id) not in existing
+        ]
+        model.objects.bulk_create(objects, ignore_conflicts=True)
+        self.count(kind, len(objects))
+        return objects
+
+    def import_subscription(self, rows):
+        self.import_relations(
+            'subscription', Subscription, 'author', self.users, rows
+        )
+
+    def import_favorite(self, rows):
+        self.import_relations(
+            'favorite', Favorite, 'recipe', self.recipes, rows
+        )
+
+    def import_shopping_cart(self, rows):
+        carts = self.import_relations(
+            'shopping_cart', ShoppingCart, 'recipe', self.recipes, rows
+        )
+        self.cart_user_ids.update(cart.user_id for cart in carts)
+
+    def import_batch(self, kind, rows):
+        handler = self.handlers.get(kind)
+        if handler is None:
+            raise CommandError(f'Неизвестный тип записи: {kind}')
+        try:
+            handler(rows)
+        except KeyError as error:
+            raise CommandError(f'{kind}: отсутствует поле {error}')
+
+    def finish(self):
+        '''
+        bulk_create sends no signals: counters, shopping lists and cache
+        versions are brought up to date once the rows are in.
+        '''
+        recount_favorites()
+        recount_recipes()
+        user_ids = sorted(self.cart_user_ids)
+        for start in range(0, len(user_ids), BATCH_SIZE):
+            end = start + BATCH_SIZE
+            refresh_shopping_lists(user_ids[start:end])
+        transaction.on_commit(self.bump_versions)
+
+    def bump_versions(self):
+        bump_version(
+            FAVORITES,
+            INGREDIENTS,
+            RECIPES,
+            SHOPPING_CART,
+            SUBSCRIPTIONS,
+            TAGS,
+            USERS,
+        )
+        user_ids = list(self.users.values())
+        for start in range(0, len(user_ids), BATCH_SIZE):
+            end = start + BATCH_SIZE
+            bump_version(
+                *(
+                    user_namespace(namespace, user_id)
+                    for user_id in user_ids[start:end]
+                    for namespace in USER_NAMESPACES
+                )
+            )
+        remove_snapshot_files('tag')
+        remove_snapshot_files('ingredient')
+
+
+class Command(BaseCommand):
+    help = (
+        'Загрузка данных, выгруженных командой export_data. '
+        'Существующие записи не изменяются'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('filepath')
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=BATCH_SIZE,
+            help='Число записей, добавляемых одним запросом',
+        )
+
+    def handle(self, *args, **options):
+        path = Path(options['filepath'])
+        if not path.exists():
+            raise CommandError('Файл "%s" не найден' % options['filepath'])
+        started = monotonic()
+        importer = Importer()
+        with open(path, encoding='utf-8') as file, transaction.atomic():
+            for kind, rows in groupby(
+                read_rows(file), key=lambda row: row['type']
+            ):
+                for batch in batched(rows, options['batch_size']):
+                    importer.import_batch(kind, batch)
+                    if options['verbosity'] > 1:
+                        self.stdout.write(
+                            f'{kind}: {importer.created.get(kind, 0)}'
+                        )
+            importer.finish()
+        self.stdout.write(
+            'Загружено: '
+            + ', '.join(
+                f'{kind} {count}' for kind, count in importer.created.items()
+            )
+            + f' за {monotonic() - started:.2f} с'
+        )
@@ -1,34 +1,165 @@
-'''
-Скрипт для загрузки списка ингредиентов из CSV-файла.
-'''
-from csv import DictReader
-from pathlib import Path
-
-from django.core.management.base import BaseCommand, CommandError
-
-from recipes.models import Ingredient
-
-COL1 = 'name'
-COL2 = 'measurement_unit'
-
-
-class Command(BaseCommand):
-    help = 'Загрузка ингредиентов из csv-файлов'
-
-    def add_arguments(self, parser):
-        parser.add_argument('filepath')
-
-    def handle(self, *args, **options):
-        Ingredient.objects.all().delete()
-        fieldnames = [COL1, COL2]
-        csv_filename = Path(options['filepath'])
-        if not csv_filename.exists():
-            raise CommandError('Файл "%s" не найден' % options['filepath'])
-        with open(csv_filename, newline='') as csv_file:
-            reader = DictReader(csv_file, fieldnames)
-            for row in reader:
-                instance = Ingredient.objects.create(
-                    name=row[COL1], measurement_unit=row[COL2]
-                )
-                instance.save
-                print(f'{instance.id}, {row[COL1]}, {row[COL2]}')
+'''
+Скрипт для загрузки списка ингредиентов из CSV- или JSON-файла.
+'''
+
+import csv
+import json
+import re
+from itertools import islice
+from pathlib import Path
+from time import monotonic
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from recipes.models import Ingredient
+from recipes.snapshots import remove_snapshot_files
+from recipes.versions import INGREDIENTS, bump_version
+
+CHUNK_SIZE = 64 * 1024
+BATCH_SIZE = 1000
+JSON_SEPARATORS = re.compile(r'[\s,]*')
+
+
+def read_csv(file):
+    reader = csv.reader(file)
+    for row in reader:
+        if not row:
+            continue
+        if len(row) != 2:
+            raise CommandError(
+                f'Строка {reader.line_num}: ожидается название '
+                'и единица измерения'
+            )
+        yield row
+
+
+def read_json(file):
+    '''
+    Yields the items of a JSON array one by one, the file is read in
+    chunks and never parsed as a whole.
+    '''
+    decoder = json.JSONDecoder()
+    buffer, position, eof, opened = '', 0, False, False
+    while True:
+        position = JSON_SEPARATORS.match(buffer, position).end()
+        if not opened and position < len(buffer):
+            if buffer[position] != '[':
+                raise CommandError('Ожидается JSON-массив ингредиентов')
+            opened, position = True, position + 1
+            continue
+        if opened and buffer.startswith(']', position):
+            return
+        try:
+            item, position = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError as error:
+            if eof:
+                raise CommandError(f'Некорректный JSON: {error}')
+            chunk = file.read(CHUNK_SIZE)
+            eof = not chunk
+            buffer, position = buffer[position:] + chunk, 0
+            continue
+        try:
+            yield item['name'], item['measurement_unit']
+        except (KeyError, TypeError):
+            raise CommandError(f'Некорректный ингредиент: {item}')
+
+
+READERS = {'csv': read_csv, 'json': read_json}
+
+
+def batched(rows, size):
+    rows = iter(rows)
+    while batch := list(islice(rows, size)):
+        yield batch
+
+
+def save_batch(rows, seen, dry_run):
+    '''
+    Creates the ingredients missing from the database and returns their
+    number. Rows are keyed on (name, measurement_unit), existing
+    ingredients and the recipes using them are left untouched. Keys new
+    in the earlier batches are collected in seen: a dry run does not save
+    them, so the database would not show them as existing.
+    '''
+    keys = dict.fromkeys(
+        (name.strip(), measurement_unit.strip())
+        for name, measurement_unit in rows
+    )
+    existing = set(
+        Ingredient.objects.filter(
+            name__in={name for name, _ in keys}
+        ).values_list('name', 'measurement_unit')
+    )
+    new = [key for key in keys if key not in existing and key not in seen]
+    seen.update(new)
+    if new and not dry_run:
+        Ingredient.objects.bulk_create(
+            [
+                Ingredient(name=name, measurement_unit=measurement_unit)
+                for name, measurement_unit in new
+            ],
+            ignore_conflicts=True,
+        )
+    return len(new)
+
+
+class Command(BaseCommand):
+    help = (
+        'Загрузка ингредиентов из csv- или json-файлов. '
+        'Существующие ингредиенты не изменяются'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('filepath')
+        parser.add_argument(
+            '--format',
+            choices=READERS,
+            help='Формат файла, по умолчанию определяется по расширению',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=BATCH_SIZE,
+            help='Число строк, добавляемых одним запросом',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только подсчитать новые ингредиенты, ничего не добавляя',
+        )
+
+    def handle(self, *args, **options):
+        path = Path(options['filepath'])
+        if not path.exists():
+            raise CommandError('Файл "%s" не найден' % options['filepath'])
+        file_format = options['format'] or path.suffix.lstrip('.').lower()
+        if file_format not in READERS:
+            raise CommandError(
+                'Формат файла "%s" не поддерживается' % options['filepath']
+            )
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size должен быть больше нуля')
+        dry_run = options['dry_run']
+        started = monotonic()
+        rows = created = 0
+        seen = set()
+        with open(path, newline='', encoding='utf-8') as file:
+            with transaction.atomic():
+                for batch in batched(
+                    READERS[file_format](file), options['batch_size']
+                ):
+                    rows += len(batch)
+                    created += save_batch(batch, seen, dry_run)
+                    if options['verbosity'] > 0:
+                        self.stdout.write(
+                            f'Обработано строк: {rows}, новых: {created}'
+                        )
+        if created and not dry_run:
+            bump_version(INGREDIENTS)
+            remove_snapshot_files('ingredient')
+        action = 'Будет добавлено' if dry_run else 'Добавлено'
+        self.stdout.write(
+            f'{action} ингредиентов: {created} из {rows} строк '
+            f'за {monotonic() - started:.2f} с'
+        )
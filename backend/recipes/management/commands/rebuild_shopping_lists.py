@@ -0,0 +1,27 @@
+'''
+Скрипт для пересчёта списков покупок пользователей.
+'''
+
+from django.core.management.base import BaseCommand
+
+from recipes.models import ShoppingCart, ShoppingListItem
+from recipes.shopping_lists import refresh_shopping_lists
+
+BATCH_SIZE = 500
+
+
+class Command(BaseCommand):
+    help = 'Пересчёт списков покупок по корзинам пользователей'
+
+    def handle(self, *args, **options):
+        user_ids = sorted(
+            set(ShoppingCart.objects.values_list('user_id', flat=True))
+            | set(ShoppingListItem.objects.values_list('user_id', flat=True))
+        )
+        items = 0
+        for start in range(0, len(user_ids), BATCH_SIZE):
+            end = start + BATCH_SIZE
+            items += refresh_shopping_lists(user_ids[start:end])
+        self.stdout.write(
+            f'Пересчитано списков: {len(user_ids)}, позиций: {items}'
+        )
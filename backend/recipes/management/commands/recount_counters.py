@@ -0,0 +1,17 @@
+'''
+Скрипт для пересчёта денормализованных счётчиков.
+'''
+
+from django.core.management.base import BaseCommand
+
+from recipes.counters import recount_favorites, recount_recipes
+from recipes.versions import RECIPES, USERS, bump_version
+
+
+class Command(BaseCommand):
+    help = 'Пересчёт счётчиков избранного и рецептов авторов'
+
+    def handle(self, *args, **options):
+        self.stdout.write(f'Исправлено рецептов: {recount_favorites()}')
+        self.stdout.write(f'Исправлено авторов: {recount_recipes()}')
+        bump_version(RECIPES, USERS)
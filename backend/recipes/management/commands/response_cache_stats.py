@@ -0,0 +1,30 @@
+'''
+Скрипт для вывода статистики кеша ответов анонимным пользователям.
+'''
+
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.mixins import HIT, MISS, get_counters
+
+BASENAMES = ('recipe', 'tag', 'ingredient')
+
+
+class Command(BaseCommand):
+    help = 'Статистика попаданий в кеш ответов анонимным пользователям'
+
+    def handle(self, *args, **options):
+        if isinstance(caches['default'], LocMemCache):
+            raise CommandError(
+                'LocMemCache хранит счётчики в памяти каждого процесса, '
+                'для статистики нужен общий кеш (CACHE_BACKEND)'
+            )
+        for basename in BASENAMES:
+            counters = get_counters(basename)
+            total = counters[HIT] + counters[MISS]
+            ratio = counters[HIT] / total if total else 0
+            self.stdout.write(
+                f'{basename}: hits={counters[HIT]}, '
+                f'misses={counters[MISS]}, hit ratio={ratio:.2%}'
+            )
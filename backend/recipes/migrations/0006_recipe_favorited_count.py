@@ -0,0 +1,49 @@
+# Generated by Django 4.1 on 2026-10-18 14:40
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_favorites(apps, schema_editor):
+    Favorite = apps.get_model('recipes', 'Favorite')
+    Recipe = apps.get_model('recipes', 'Recipe')
+    Recipe.objects.update(
+        favorited_count=Coalesce(
+            Subquery(
+                Favorite.objects.filter(recipe=OuterRef('pk'))
+                .order_by()
+                .values('recipe')
+                .annotate(count=Count('id'))
+                .values('count')
+            ),
+            0,
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0005_recipe_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='favorited_count',
+            field=models.PositiveIntegerField(
+                default=0,
+                editable=False,
+                verbose_name='Добавления в избранное',
+            ),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(
+                fields=['-favorited_count', '-id'],
+                name='recipe_favorited_count_idx',
+            ),
+        ),
+        migrations.RunPython(count_favorites, migrations.RunPython.noop),
+    ]
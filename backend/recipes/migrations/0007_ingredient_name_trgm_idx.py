@@ -0,0 +1,28 @@
+from django.db import migrations
+
+CREATE_INDEX = (
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    'CREATE INDEX IF NOT EXISTS ingredient_name_trgm_idx '
+    'ON recipes_ingredient USING gin (UPPER(name::text) gin_trgm_ops)',
+)
+DROP_INDEX = ('DROP INDEX IF EXISTS ingredient_name_trgm_idx',)
+
+
+def execute(statements):
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor == 'postgresql':
+            for statement in statements:
+                schema_editor.execute(statement)
+
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0006_recipe_favorited_count'),
+    ]
+
+    operations = [
+        migrations.RunPython(execute(CREATE_INDEX), execute(DROP_INDEX)),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.1 on 2026-10-18 14:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0007_ingredient_name_trgm_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='image_variants',
+            field=models.JSONField(
+                blank=True,
+                default=dict,
+                editable=False,
+                verbose_name='Уменьшенные картинки',
+            ),
+        ),
+    ]
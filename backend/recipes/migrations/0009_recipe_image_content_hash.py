@@ -0,0 +1,21 @@
+# Generated by Django 4.1 on 2026-10-18 14:14
+
+from django.db import migrations
+import recipes.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0008_recipe_image_variants'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='recipe',
+            name='image',
+            field=recipes.models.ContentHashImageField(
+                upload_to='recipes/images/', verbose_name='Картинка'
+            ),
+        ),
+    ]
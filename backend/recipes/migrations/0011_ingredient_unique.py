@@ -0,0 +1,68 @@
+# Generated by Django 4.1 on 2026-10-18 14:26
+
+from itertools import groupby
+from operator import attrgetter
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def merge_rows(model, owner, survivor, ids):
+    '''
+    Points the rows of the duplicate ingredients to the survivor. Rows
+    of one owner (recipe or user) are merged into one, amounts summed.
+    '''
+    rows = model.objects.filter(ingredient_id__in=[survivor, *ids]).order_by(
+        owner, 'id'
+    )
+    for _, group in groupby(rows, key=attrgetter(owner)):
+        first, *rest = group
+        if rest:
+            first.amount += sum(row.amount for row in rest)
+            model.objects.filter(id__in=[row.id for row in rest]).delete()
+        first.ingredient_id = survivor
+        first.save(update_fields=['ingredient_id', 'amount'])
+
+
+def merge_duplicates(apps, schema_editor):
+    '''
+    Keeps the oldest of the ingredients sharing a name and measurement
+    unit, the recipes and shopping lists of the others move to it.
+    '''
+    Ingredient = apps.get_model('recipes', 'Ingredient')
+    RecipeIngredient = apps.get_model('recipes', 'RecipeIngredient')
+    ShoppingListItem = apps.get_model('recipes', 'ShoppingListItem')
+    duplicates = (
+        Ingredient.objects.values('name', 'measurement_unit')
+        .annotate(survivor=Min('id'), count=Count('id'))
+        .filter(count__gt=1)
+        .order_by()
+    )
+    for group in duplicates:
+        ids = list(
+            Ingredient.objects.filter(
+                name=group['name'], measurement_unit=group['measurement_unit']
+            )
+            .exclude(id=group['survivor'])
+            .values_list('id', flat=True)
+        )
+        merge_rows(RecipeIngredient, 'recipe_id', group['survivor'], ids)
+        merge_rows(ShoppingListItem, 'user_id', group['survivor'], ids)
+        Ingredient.objects.filter(id__in=ids).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0010_shoppinglistitem'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='ingredient',
+            constraint=models.UniqueConstraint(
+                fields=('name', 'measurement_unit'), name='unique_ingredient'
+            ),
+        ),
+    ]
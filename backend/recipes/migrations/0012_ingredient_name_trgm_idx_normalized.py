@@ -0,0 +1,32 @@
+from django.db import migrations
+
+CREATE_INDEX = (
+    'DROP INDEX IF EXISTS ingredient_name_trgm_idx',
+    'CREATE INDEX ingredient_name_trgm_idx ON recipes_ingredient '
+    "USING gin ((REPLACE(LOWER(name::text), 'ё', 'е')) gin_trgm_ops)",
+)
+DROP_INDEX = (
+    'DROP INDEX IF EXISTS ingredient_name_trgm_idx',
+    'CREATE INDEX ingredient_name_trgm_idx '
+    'ON recipes_ingredient USING gin (UPPER(name::text) gin_trgm_ops)',
+)
+
+
+def execute(statements):
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor == 'postgresql':
+            for statement in statements:
+                schema_editor.execute(statement)
+
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0011_ingredient_unique'),
+    ]
+
+    operations = [
+        migrations.RunPython(execute(CREATE_INDEX), execute(DROP_INDEX)),
+    ]
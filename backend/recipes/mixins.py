@@ -0,0 +1,185 @@
+from hashlib import md5
+
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.cache import patch_vary_headers
+from django.utils.http import http_date, parse_etags
+from rest_framework import status
+from rest_framework.response import Response
+
+from .relations import create_relations, delete_relations
+from .serializers import BulkIdsSerializer
+from .versions import get_version, user_namespace
+
+CREATED = 'created'
+EXISTS = 'exists'
+DELETED = 'deleted'
+MISSING = 'missing'
+NOT_FOUND = 'not_found'
+
+CACHE_HEADER = 'X-Cache'
+HIT = 'HIT'
+MISS = 'MISS'
+COUNTER_KEY = 'response_cache:{}:{}'
+
+
+def increment_counter(basename, name):
+    key = COUNTER_KEY.format(basename, name)
+    cache.add(key, 0, None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, None)
+
+
+def get_counters(basename):
+    return {
+        name: cache.get(COUNTER_KEY.format(basename, name), 0)
+        for name in (HIT, MISS)
+    }
+
+
+class AnonymousCacheMixin:
+    '''
+    Caches list responses for anonymous users.
+    The key is built from the path, the listed query parameters and the
+    versions of the data sets the response depends on.
+    '''
+
+    cache_namespaces = ()
+    cache_query_params = ()
+    cache_timeout = 60 * 60
+
+    def get_cache_key(self, request):
+        params = [
+            (param, sorted(request.query_params.getlist(param)))
+            for param in self.cache_query_params
+        ]
+        signature = md5(
+            repr((request.get_host(), request.path, params)).encode()
+        ).hexdigest()
+        version = get_version(*self.cache_namespaces)
+        return f'response:{self.basename}:{version}:{signature}'
+
+    def list(self, request, *args, **kwargs):
+        if request.user.is_authenticated:
+            return super().list(request, *args, **kwargs)
+        key = self.get_cache_key(request)
+        cached = cache.get(key)
+        if cached is not None:
+            increment_counter(self.basename, HIT)
+            data, headers = cached
+            return Response(data, headers={**headers, CACHE_HEADER: HIT})
+        increment_counter(self.basename, MISS)
+        response = super().list(request, *args, **kwargs)
+        headers = {
+            header: value
+            for header, value in response.items()
+            if header != 'Content-Type'
+        }
+        cache.set(key, (response.data, headers), self.cache_timeout)
+        response[CACHE_HEADER] = MISS
+        return response
+
+
+class ConditionalGetMixin:
+    '''
+    Adds ETag and Last-Modified validators to list and retrieve responses
+    and answers 304 without rendering the body when If-None-Match holds
+    the current validator. The view provides the validator state with
+    get_validator_state(); per-user data sets listed in
+    validator_user_namespaces are mixed into the ETag.
+    '''
+
+    validator_namespaces = ()
+    validator_user_namespaces = ()
+
+    def get_validator_state(self):
+        '''
+        Returns (last_modified, state); the default None sends no
+        validators.
+        '''
+
+    def get_etag(self, request, state):
+        namespaces = list(self.validator_namespaces)
+        if request.user.is_authenticated:
+            namespaces += [
+                user_namespace(namespace, request.user.id)
+                for namespace in self.validator_user_namespaces
+            ]
+        signature = (
+            request.get_full_path(),
+            request.user.id,
+            state,
+            get_version(*namespaces),
+        )
+        return '"%s"' % md5(repr(signature).encode()).hexdigest()
+
+    def conditional_response(self, handler, request, *args, **kwargs):
+        validator_state = self.get_validator_state()
+        if validator_state is None:
+            return handler(request, *args, **kwargs)
+        last_modified, state = validator_state
+        etag = self.get_etag(request, state)
+        etags = parse_etags(request.headers.get('If-None-Match', ''))
+        if '*' in etags or etag in [tag.removeprefix('W/') for tag in etags]:
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = handler(request, *args, **kwargs)
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified.timestamp())
+        patch_vary_headers(response, ('Authorization',))
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(
+            super().list, request, *args, **kwargs
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_response(
+            super().retrieve, request, *args, **kwargs
+        )
+
+
+class BulkRelationsMixin:
+    '''
+    Creates (POST) or deletes (DELETE) relations of the current user to
+    up to BULK_IDS_LIMIT objects in one request. The ids are checked with
+    one query and changed with one statement; the response reports the
+    outcome for every id.
+    '''
+
+    @transaction.atomic
+    def bulk_toggle_relations(
+        self, request, target_model, model, field, on_change, exclude=()
+    ):
+        serializer = BulkIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = serializer.validated_data['ids']
+        found = set(
+            target_model.objects.filter(id__in=ids)
+            .exclude(id__in=exclude)
+            .values_list('id', flat=True)
+        )
+        valid = [id for id in ids if id in found]
+        if request.method == 'DELETE':
+            change, delta = delete_relations, -1
+            changed_status, unchanged_status = DELETED, MISSING
+        else:
+            change, delta = create_relations, 1
+            changed_status, unchanged_status = CREATED, EXISTS
+        changed = (
+            set(change(model, request.user.id, field, valid))
+            if valid
+            else set()
+        )
+        if changed:
+            on_change(request.user.id, list(changed), delta)
+        statuses = dict.fromkeys(found, unchanged_status)
+        statuses.update(dict.fromkeys(changed, changed_status))
+        results = [
+            {'id': id, 'status': statuses.get(id, NOT_FOUND)} for id in ids
+        ]
+        return Response({'results': results})
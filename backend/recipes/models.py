@@ -1,3 +1,6 @@
+from hashlib import sha256
+from pathlib import PurePosixPath
+
 from colorfield.fields import ColorField
 from django.core.validators import MinValueValidator
 from django.db import models
@@ -27,6 +30,11 @@ class Ingredient(models.Model):
         indexes = [
             models.Index(fields=['name'], name='name_idx'),
         ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['name', 'measurement_unit'], name='unique_ingredient'
+            ),
+        ]
         verbose_name = 'Ингредиент'
         verbose_name_plural = 'Ингредиенты'
 
@@ -34,6 +42,30 @@ class Ingredient(models.Model):
         return f'{self.name} ({self.measurement_unit})'.capitalize()
 
 
+class ContentHashImageField(models.ImageField):
+    '''
+    Image field storing files under the hash of their content.
+    An upload identical to a stored file reuses it instead of writing
+    a copy.
+    '''
+
+    def pre_save(self, model_instance, add):
+        file = getattr(model_instance, self.attname)
+        if not file or file._committed:
+            return super().pre_save(model_instance, add)
+        digest = sha256()
+        for chunk in file.file.chunks():
+            digest.update(chunk)
+        filename = digest.hexdigest() + PurePosixPath(file.name).suffix.lower()
+        name = self.generate_filename(model_instance, filename)
+        if self.storage.exists(name):
+            file.name = name
+            file._committed = True
+        else:
+            file.save(filename, file.file, save=False)
+        return file
+
+
 class Recipe(models.Model):
     ingredients = models.ManyToManyField(
         Ingredient,
@@ -48,7 +80,10 @@ class Recipe(models.Model):
         verbose_name='Автор',
     )
     name = models.CharField('Название', max_length=200)
-    image = models.ImageField('Картинка', upload_to='recipes/images/')
+    image = ContentHashImageField('Картинка', upload_to='recipes/images/')
+    image_variants = models.JSONField(
+        'Уменьшенные картинки', default=dict, blank=True, editable=False
+    )
     text = models.TextField('Описание')
     cooking_time = models.PositiveSmallIntegerField(
         'Время приготовления (в минутах)',
@@ -57,15 +92,22 @@ class Recipe(models.Model):
         ],
     )
     pub_date = models.DateTimeField('Дата публикации', auto_now_add=True)
-
-    @property
-    def favorited_count(self):
-        return self.favorite.count()
-
-    favorited_count.fget.short_description = "Добавления в избранное"
+    updated_at = models.DateTimeField('Дата изменения', auto_now=True)
+    favorited_count = models.PositiveIntegerField(
+        'Добавления в избранное', default=0, editable=False
+    )
 
     class Meta:
-        ordering = ['-pub_date']
+        indexes = [
+            models.Index(
+                fields=['-pub_date', '-id'], name='recipe_pub_date_idx'
+            ),
+            models.Index(
+                fields=['-favorited_count', '-id'],
+                name='recipe_favorited_count_idx',
+            ),
+        ]
+        ordering = ['-pub_date', '-id']
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
 
@@ -147,3 +189,27 @@ class ShoppingCart(models.Model):
         ordering = ['user']
         verbose_name = 'Список покупок'
         verbose_name_plural = 'Списки покупок'
+
+
+class ShoppingListItem(models.Model):
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='shopping_list',
+        verbose_name='Пользователь',
+    )
+    ingredient = models.ForeignKey(
+        Ingredient, on_delete=models.CASCADE, verbose_name='Ингредиент'
+    )
+    amount = models.PositiveIntegerField('Количество')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='unique_shopping_list_item',
+            ),
+        ]
+        ordering = ['user']
+        verbose_name = 'Позиция списка покупок'
+        verbose_name_plural = 'Позиции списков покупок'
@@ -1,6 +1,137 @@
-from rest_framework.pagination import PageNumberPagination
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as DecodeError
+from datetime import datetime
+
+from django.core.paginator import Paginator
+from django.db.models import Q
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from .counts import get_count
+from .versions import FAVORITES, RECIPES, SHOPPING_CART
+
+NEXT = 'n'
+PREVIOUS = 'p'
+COUNT_STRATEGY_HEADER = 'X-Count-Strategy'
+
+
+class RecipesPaginator(Paginator):
+    count_namespaces = (RECIPES, FAVORITES, SHOPPING_CART)
+
+    @cached_property
+    def count(self):
+        count, self.count_strategy = get_count(
+            self.object_list, self.count_namespaces
+        )
+        return count
+
+
+class RecipesCursorPagination(CursorPagination):
+    '''
+    Keyset pagination over the (pub_date, id) key in descending order.
+    Every page is a single index range scan, so deep pages cost the same
+    as the first one and no COUNT(*) is issued.
+    '''
+
+    ordering = ('-pub_date', '-id')
+    page_size_query_param = 'limit'
+    page_size = 6
+    max_page_size = 100
+    invalid_cursor_message = 'Неверный курсор.'
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            direction, pub_date, pk = (
+                urlsafe_b64decode(encoded.encode()).decode().split('|')
+            )
+            if direction not in (NEXT, PREVIOUS):
+                raise ValueError
+            return direction, datetime.fromisoformat(pub_date), int(pk)
+        except (DecodeError, UnicodeDecodeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, direction, recipe):
+        cursor = f'{direction}|{recipe.pub_date.isoformat()}|{recipe.pk}'
+        return replace_query_param(
+            self.base_url,
+            self.cursor_query_param,
+            urlsafe_b64encode(cursor.encode()).decode(),
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        cursor = self.decode_cursor(request)
+        if cursor is None or cursor[0] == NEXT:
+            queryset = queryset.order_by(*self.ordering)
+        else:
+            queryset = queryset.order_by('pub_date', 'id')
+        if cursor is not None:
+            direction, pub_date, pk = cursor
+            lookup = 'lt' if direction == NEXT else 'gt'
+            queryset = queryset.filter(
+                Q(**{f'pub_date__{lookup}': pub_date})
+                | Q(pub_date=pub_date, **{f'id__{lookup}': pk})
+            )
+        results = list(queryset[: self.page_size + 1])
+        has_more = len(results) > self.page_size
+        results = results[: self.page_size]
+        if cursor is not None and cursor[0] == PREVIOUS:
+            results.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, cursor is not None
+        self.page = results
+        return results
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(NEXT, self.page[-1])
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(PREVIOUS, self.page[0])
 
 
 class RecipesPagination(PageNumberPagination):
+    '''
+    Page number pagination used by the frontend.
+    Passing the cursor parameter switches to keyset pagination. The cursor
+    holds the (pub_date, id) key only, so combining it with ordering is
+    rejected instead of silently returning the default order.
+    '''
+
+    django_paginator_class = RecipesPaginator
     page_size_query_param = 'limit'
     page_size = 6
+    cursor_pagination_class = RecipesCursorPagination
+    ordering_query_param = 'ordering'
+    cursor_ordering_message = (
+        'Параметр ordering нельзя использовать вместе с cursor.'
+    )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_paginator = None
+        cursor_paginator = self.cursor_pagination_class()
+        if cursor_paginator.cursor_query_param in request.query_params:
+            if self.ordering_query_param in request.query_params:
+                raise ValidationError({'errors': self.cursor_ordering_message})
+            self.cursor_paginator = cursor_paginator
+            return cursor_paginator.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.get_paginated_response(data)
+        response = super().get_paginated_response(data)
+        response[COUNT_STRATEGY_HEADER] = self.page.paginator.count_strategy
+        return response
@@ -0,0 +1,156 @@
+'''
+Single statement creation and deletion of unique user relations
+(favorites, shopping carts, subscriptions).
+
+INSERT ... ON CONFLICT DO NOTHING and DELETE ... RETURNING let the
+database decide whether the row changed, so concurrent toggles neither
+race nor fail on the unique constraints. Both statements are supported
+by PostgreSQL and SQLite 3.35+. post_save and post_delete are sent for
+the changed row in the same transaction, so signal receivers keep
+counters in sync; versions are bumped once the transaction commits, so
+no request caches the old rows under the new version. The transaction
+starts with the write: SQLite fails at once, without waiting for the
+lock, when a transaction that has only read so far tries to write while
+another one writes.
+
+The bulk variants change many rows of one user at once and send no
+signals; callers apply the side effects with the *_changed functions,
+the same ones the signal receivers call.
+'''
+
+from django.db import connection, transaction
+from django.db.models.signals import post_delete, post_save
+
+from .counters import change_favorited_count
+from .shopping_lists import get_ingredient_ids, refresh_shopping_lists
+from .versions import (FAVORITES, SHOPPING_CART, SUBSCRIPTIONS, USERS,
+                       bump_version, user_namespace)
+
+
+def get_columns(model, values):
+    return [model._meta.get_field(name).column for name in values]
+
+
+@transaction.atomic
+def create_relation(model, **values):
+    '''
+    Inserts the row unless it already exists, returns whether it was
+    inserted. Values are given by attname, e.g. recipe_id.
+    '''
+    quote = connection.ops.quote_name
+    columns = ', '.join(quote(column) for column in get_columns(model, values))
+    placeholders = ', '.join(['%s'] * len(values))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {quote(model._meta.db_table)} ({columns}) '
+            f'VALUES ({placeholders}) ON CONFLICT DO NOTHING '
+            f'RETURNING {quote(model._meta.pk.column)}',
+            list(values.values()),
+        )
+        row = cursor.fetchone()
+    if row is None:
+        return False
+    instance = model(pk=row[0], **values)
+    post_save.send(
+        sender=model,
+        instance=instance,
+        created=True,
+        update_fields=None,
+        raw=False,
+        using=connection.alias,
+    )
+    return True
+
+
+@transaction.atomic
+def delete_relation(model, **values):
+    '''
+    Deletes the row if it exists, returns whether it was deleted.
+    '''
+    quote = connection.ops.quote_name
+    conditions = ' AND '.join(
+        f'{quote(column)} = %s' for column in get_columns(model, values)
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {quote(model._meta.db_table)} WHERE {conditions} '
+            f'RETURNING {quote(model._meta.pk.column)}',
+            list(values.values()),
+        )
+        row = cursor.fetchone()
+    if row is None:
+        return False
+    instance = model(pk=row[0], **values)
+    post_delete.send(
+        sender=model,
+        instance=instance,
+        using=connection.alias,
+        origin=instance,
+    )
+    return True
+
+
+def create_relations(model, user_id, field, ids):
+    '''
+    Inserts the missing (user, id) rows in one statement and returns the
+    ids of the inserted ones.
+    '''
+    quote = connection.ops.quote_name
+    user_column, column = get_columns(model, ('user_id', field))
+    rows = ', '.join(['(%s, %s)'] * len(ids))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {quote(model._meta.db_table)} '
+            f'({quote(user_column)}, {quote(column)}) VALUES {rows} '
+            f'ON CONFLICT DO NOTHING RETURNING {quote(column)}',
+            [value for id in ids for value in (user_id, id)],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def delete_relations(model, user_id, field, ids):
+    '''
+    Deletes the existing (user, id) rows in one statement and returns the
+    ids of the deleted ones.
+    '''
+    quote = connection.ops.quote_name
+    user_column, column = get_columns(model, ('user_id', field))
+    placeholders = ', '.join(['%s'] * len(ids))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {quote(model._meta.db_table)} '
+            f'WHERE {quote(user_column)} = %s '
+            f'AND {quote(column)} IN ({placeholders}) '
+            f'RETURNING {quote(column)}',
+            [user_id, *ids],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def favorites_changed(user_id, recipe_ids, delta):
+    '''
+    The user added (delta 1) or removed (delta -1) the recipes from the
+    favorites. delta 0 leaves the counters alone.
+    '''
+    if delta:
+        change_favorited_count(recipe_ids, delta)
+    namespaces = (FAVORITES, user_namespace(FAVORITES, user_id))
+    transaction.on_commit(lambda: bump_version(*namespaces))
+
+
+def shopping_cart_changed(user_id, recipe_ids, delta):
+    '''
+    The user added or removed the recipes from the cart. recipe_ids None
+    refreshes the whole shopping list, an empty list none of it.
+    '''
+    if recipe_ids is None:
+        refresh_shopping_lists([user_id])
+    elif recipe_ids:
+        refresh_shopping_lists([user_id], get_ingredient_ids(recipe_ids))
+    namespaces = (SHOPPING_CART, user_namespace(SHOPPING_CART, user_id))
+    transaction.on_commit(lambda: bump_version(*namespaces))
+
+
+def subscriptions_changed(user_id, author_ids, delta):
+    namespaces = (USERS, user_namespace(SUBSCRIPTIONS, user_id))
+    transaction.on_commit(lambda: bump_version(*namespaces))
@@ -0,0 +1,99 @@
+'''
+Ingredient autocomplete.
+
+The catalog is small and rarely changes, so every worker keeps a sorted
+in-memory index of it and answers ?name= without touching the database.
+The index is rebuilt when the ingredients version changes. Catalogs
+larger than INDEX_SIZE_LIMIT are searched in the database instead,
+which PostgreSQL serves from a trigram index. Both paths compare names
+normalized the same way: lowercase, with ё read as е.
+'''
+
+from bisect import bisect_left
+from threading import Lock
+
+from django.db.models import Case, IntegerField, Value, When
+from django.db.models.functions import Lower, Replace
+
+from .models import Ingredient
+from .versions import INGREDIENTS, get_version
+
+INDEX_SIZE_LIMIT = 50000
+FIELDS = ('id', 'name', 'measurement_unit')
+
+
+def normalize(text):
+    return text.casefold().replace('ё', 'е')
+
+
+def normalized_name():
+    '''
+    normalize() in SQL, matching the ingredient_name_trgm_idx expression.
+    '''
+    return Replace(Lower('name'), Value('ё'), Value('е'))
+
+
+class IngredientIndex:
+    def __init__(self):
+        self.lock = Lock()
+        self.version = None
+        self.entries = None
+
+    def refresh(self):
+        version = get_version(INGREDIENTS)
+        if version == self.version:
+            return
+        with self.lock:
+            if version == self.version:
+                return
+            if Ingredient.objects.count() > INDEX_SIZE_LIMIT:
+                entries = None
+            else:
+                rows = Ingredient.objects.values(*FIELDS)
+                pairs = sorted(
+                    ((normalize(row['name']), row) for row in rows),
+                    key=lambda pair: (pair[0], pair[1]['id']),
+                )
+                entries = (
+                    [key for key, _ in pairs],
+                    [row for _, row in pairs],
+                )
+            self.entries, self.version = entries, version
+
+    def search_database(self, query):
+        query = normalize(query)
+        return list(
+            Ingredient.objects.annotate(key=normalized_name())
+            .filter(key__contains=query)
+            .annotate(
+                rank=Case(
+                    When(key__startswith=query, then=Value(0)),
+                    default=Value(1),
+                    output_field=IntegerField(),
+                )
+            )
+            .order_by('rank', 'name')
+            .values(*FIELDS)
+        )
+
+    def search(self, query):
+        '''
+        Returns ingredients whose name starts with the query followed by
+        those containing it elsewhere, both sorted by name.
+        '''
+        self.refresh()
+        if self.entries is None:
+            return self.search_database(query)
+        keys, rows = self.entries
+        query = normalize(query)
+        end = start = bisect_left(keys, query)
+        while end < len(keys) and keys[end].startswith(query):
+            end += 1
+        return rows[start:end] + [
+            rows[i]
+            for i, key in enumerate(keys)
+            if query in key and not (start <= i < end)
+        ]
+
+
+ingredient_index = IngredientIndex()
@@ -1,8 +1,12 @@
+import json
+
+from django.conf import settings
 from rest_framework import serializers
+from rest_framework.utils import html
 
 from users.serializers import UserSerializer
 
-from .fields import Base64ImageField
+from .fields import Base64ImageField, ImageVariantsField
 from .models import (Favorite, Ingredient, Recipe, RecipeIngredient,
                      ShoppingCart, Tag)
 
@@ -32,9 +36,34 @@ class RecipeIngredientSerializer(serializers.ModelSerializer):
         fields = ('id', 'amount')
 
 
+class JSONListSerializer(serializers.ListSerializer):
+    '''
+    Accepts the list as a JSON string in multipart form data.
+    '''
+
+    def get_value(self, dictionary):
+        value = dictionary.get(self.field_name)
+        if html.is_html_input(dictionary) and isinstance(value, str):
+            try:
+                return json.loads(value)
+            except ValueError:
+                return value
+        return super().get_value(dictionary)
+
+
+class RecipeIngredientWriteSerializer(serializers.ModelSerializer):
+    id = serializers.IntegerField(source='ingredient_id')
+
+    class Meta:
+        model = RecipeIngredient
+        fields = ('id', 'amount')
+        list_serializer_class = JSONListSerializer
+
+
 class RecipeListSerializer(serializers.ModelSerializer):
     tags = TagSerializer(many=True)
     image = serializers.ImageField()
+    image_variants = ImageVariantsField()
     author = UserSerializer()
     ingredients = IngredientSerializer(many=True, read_only=True)
     is_favorited = serializers.SerializerMethodField()
@@ -52,12 +81,16 @@ class RecipeListSerializer(serializers.ModelSerializer):
             IS_IN_SHOPPING_CART,
             'name',
             'image',
+            'image_variants',
             'text',
             'cooking_time',
+            'favorited_count',
             'recipe_ingredients',
         )
 
     def get_is_favorited(self, recipe):
+        if hasattr(recipe, IS_FAVORITED):
+            return getattr(recipe, IS_FAVORITED)
         return (
             (user := self.context['request'].user)
             and user.is_authenticated
@@ -65,6 +98,8 @@ class RecipeListSerializer(serializers.ModelSerializer):
         )
 
     def get_is_in_shopping_cart(self, recipe):
+        if hasattr(recipe, IS_IN_SHOPPING_CART):
+            return getattr(recipe, IS_IN_SHOPPING_CART)
         return (
             (user := self.context['request'].user)
             and user.is_authenticated
@@ -81,7 +116,10 @@ class RecipeListSerializer(serializers.ModelSerializer):
 
 
 class RecipeSerializer(serializers.ModelSerializer):
-    ingredients = RecipeIngredientSerializer(many=True, write_only=True)
+    ingredients = RecipeIngredientWriteSerializer(many=True, write_only=True)
+    tags = serializers.ListField(
+        child=serializers.IntegerField(), allow_empty=False, write_only=True
+    )
     image = Base64ImageField()
 
     class Meta:
@@ -95,16 +133,51 @@ class RecipeSerializer(serializers.ModelSerializer):
             'cooking_time',
         )
 
+    def close_files(self):
+        self.fields['image'].close_files()
+
     def validate(self, data):
-        values = [item['ingredient'].id for item in data['ingredients']]
-        if len(values) != len(set(values)):
-            raise serializers.ValidationError(
-                {'errors': 'Ингредиенты не должны повторяться'}
+        if 'ingredients' in data:
+            values = [item['ingredient_id'] for item in data['ingredients']]
+            if len(values) != len(set(values)):
+                raise serializers.ValidationError(
+                    {'errors': 'Ингредиенты не должны повторяться'}
+                )
+            found = Ingredient.objects.filter(id__in=values).values_list(
+                'id', flat=True
             )
+            if missing := set(values) - set(found):
+                raise serializers.ValidationError(
+                    {'errors': f'Ингредиенты не найдены: {sorted(missing)}'}
+                )
+        if 'tags' in data:
+            if len(data['tags']) != len(set(data['tags'])):
+                raise serializers.ValidationError(
+                    {'errors': 'Теги не должны повторяться'}
+                )
+            tags = Tag.objects.filter(id__in=data['tags'])
+            if missing := set(data['tags']) - {tag.id for tag in tags}:
+                raise serializers.ValidationError(
+                    {'errors': f'Теги не найдены: {sorted(missing)}'}
+                )
+            data['tags'] = tags
         return data
 
 
 class FavoriteSerializer(serializers.ModelSerializer):
+    image_variants = ImageVariantsField()
+
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'image_variants', 'cooking_time')
+
+
+class BulkIdsSerializer(serializers.Serializer):
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=settings.BULK_IDS_LIMIT,
+    )
+
+    def validate_ids(self, ids):
+        return list(dict.fromkeys(ids))
@@ -0,0 +1,65 @@
+'''
+Shopping lists kept as per-user ingredient totals.
+
+ShoppingListItem holds the sum of an ingredient's amounts over the
+recipes in a user's cart. Every change to a cart or to the ingredients
+of a carted recipe recomputes the affected (user, ingredient) totals from
+the source tables within the same transaction, so the lists cannot drift
+and downloading one is a single indexed read.
+'''
+
+from django.db import transaction
+from django.db.models import Sum
+
+from users.models import User
+
+from .models import RecipeIngredient, ShoppingCart, ShoppingListItem
+
+CART_USER = 'recipe__shopping_cart__user_id'
+
+
+def get_cart_user_ids(recipe_ids):
+    return ShoppingCart.objects.filter(recipe_id__in=recipe_ids).values_list(
+        'user_id', flat=True
+    )
+
+
+def get_ingredient_ids(recipe_ids):
+    return RecipeIngredient.objects.filter(
+        recipe_id__in=recipe_ids
+    ).values_list('ingredient_id', flat=True)
+
+
+@transaction.atomic
+def refresh_shopping_lists(user_ids, ingredient_ids=None):
+    '''
+    Recomputes the totals of the users for the given ingredients, or for
+    all ingredients when none are given. Both arguments may be querysets.
+    Returns the number of stored items.
+    '''
+    user_ids = list(
+        User.objects.select_for_update()
+        .filter(id__in=user_ids)
+        .order_by('id')
+        .values_list('id', flat=True)
+    )
+    if not user_ids:
+        return 0
+    items = ShoppingListItem.objects.filter(user_id__in=user_ids)
+    amounts = RecipeIngredient.objects.filter(**{f'{CART_USER}__in': user_ids})
+    if ingredient_ids is not None:
+        items = items.filter(ingredient_id__in=ingredient_ids)
+        amounts = amounts.filter(ingredient_id__in=ingredient_ids)
+    items.delete()
+    return len(
+        ShoppingListItem.objects.bulk_create(
+            ShoppingListItem(
+                user_id=user_id, ingredient_id=ingredient_id, amount=amount
+            )
+            for user_id, ingredient_id, amount in amounts.values(
+                CART_USER, 'ingredient_id'
+            )
+            .annotate(total=Sum('amount'))
+            .values_list(CART_USER, 'ingredient_id', 'total')
+        )
+    )
@@ -0,0 +1,130 @@
+from django.db import transaction
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_delete)
+from django.dispatch import receiver
+from django.utils import timezone
+
+from users.models import User
+
+from .counters import change_recipes_count
+from .models import (Favorite, Ingredient, Recipe, RecipeIngredient,
+                     ShoppingCart, Tag)
+from .relations import favorites_changed, shopping_cart_changed
+from .shopping_lists import (get_cart_user_ids, get_ingredient_ids,
+                             refresh_shopping_lists)
+from .snapshots import remove_snapshot_files
+from .versions import INGREDIENTS, RECIPES, TAGS, bump_version
+
+
+def get_origin_model(origin):
+    '''
+    Returns the model of the instance or queryset that started a delete.
+    '''
+    return getattr(origin, 'model', type(origin))
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_created(instance, created, **kwargs):
+    if created:
+        change_recipes_count([instance.author_id], 1)
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_deleted(instance, origin=None, **kwargs):
+    if get_origin_model(origin) is not User:
+        change_recipes_count([instance.author_id], -1)
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(post_save, sender=RecipeIngredient)
+@receiver(post_delete, sender=RecipeIngredient)
+def recipes_changed(action=None, **kwargs):
+    if action is None or action.startswith('post_'):
+        transaction.on_commit(lambda: bump_version(RECIPES))
+
+
+@receiver(post_save, sender=RecipeIngredient)
+@receiver(post_delete, sender=RecipeIngredient)
+def recipe_ingredients_changed(instance, origin=None, **kwargs):
+    # Recipe and ingredient deletions cascade here, skip them
+    if origin is None or get_origin_model(origin) is RecipeIngredient:
+        Recipe.objects.filter(pk=instance.recipe_id).update(
+            updated_at=timezone.now()
+        )
+        refresh_shopping_lists(
+            get_cart_user_ids([instance.recipe_id]), [instance.ingredient_id]
+        )
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def recipe_tags_changed(instance, action, reverse, **kwargs):
+    if not action.startswith('post_'):
+        return
+    if reverse:
+        transaction.on_commit(lambda: bump_version(TAGS))
+    else:
+        Recipe.objects.filter(pk=instance.pk).update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=Favorite)
+def favorite_created(instance, created, **kwargs):
+    favorites_changed(instance.user_id, [instance.recipe_id], int(created))
+
+
+@receiver(post_delete, sender=Favorite)
+def favorite_deleted(instance, origin=None, **kwargs):
+    # Deleted recipes take their counters with them
+    delta = 0 if get_origin_model(origin) is Recipe else -1
+    favorites_changed(instance.user_id, [instance.recipe_id], delta)
+
+
+@receiver(post_save, sender=ShoppingCart)
+def shopping_cart_saved(instance, created, **kwargs):
+    # An edited row may point to another recipe, refresh the whole list
+    shopping_cart_changed(
+        instance.user_id,
+        [instance.recipe_id] if created else None,
+        int(created),
+    )
+
+
+@receiver(post_delete, sender=ShoppingCart)
+def shopping_cart_deleted(instance, origin=None, **kwargs):
+    # Recipe deletions refresh the lists themselves, user deletions
+    # cascade to them
+    if get_origin_model(origin) in (Recipe, User):
+        recipe_ids = []
+    else:
+        recipe_ids = [instance.recipe_id]
+    shopping_cart_changed(instance.user_id, recipe_ids, -1)
+
+
+@receiver(pre_delete, sender=Recipe)
+def recipe_deleting(instance, **kwargs):
+    instance.shopping_list_scope = (
+        list(get_cart_user_ids([instance.pk])),
+        list(get_ingredient_ids([instance.pk])),
+    )
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_shopping_lists_changed(instance, **kwargs):
+    user_ids, ingredient_ids = instance.shopping_list_scope
+    if user_ids:
+        refresh_shopping_lists(user_ids, ingredient_ids)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def tags_changed(**kwargs):
+    transaction.on_commit(lambda: bump_version(TAGS))
+    remove_snapshot_files('tag')
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def ingredients_changed(**kwargs):
+    transaction.on_commit(lambda: bump_version(INGREDIENTS))
+    remove_snapshot_files('ingredient')
@@ -0,0 +1,166 @@
+'''
+Precompressed snapshots of the tag and ingredient catalogs.
+
+The unfiltered catalog is rendered once per data set version into JSON,
+gzip and, when the brotli package is installed, brotli bytes kept in
+worker memory. When CATALOG_SNAPSHOT_ROOT is set the same bytes are
+written there as <basename>.json[.gz|.br] for nginx to serve; the files
+are removed as soon as the catalog changes.
+'''
+
+import gzip
+import os
+from dataclasses import dataclass
+from threading import Lock
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags
+from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+from .mixins import CACHE_HEADER, HIT, MISS, increment_counter
+from .versions import get_version
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+GZIP = 'gzip'
+BROTLI = 'br'
+EXTENSIONS = {None: '.json', GZIP: '.json.gz', BROTLI: '.json.br'}
+
+
+@dataclass(frozen=True)
+class Snapshot:
+    version: str
+    etag: str
+    data: list
+    bodies: dict
+
+
+def compress(body):
+    bodies = {None: body, GZIP: gzip.compress(body, 9, mtime=0)}
+    if brotli is not None:
+        bodies[BROTLI] = brotli.compress(body)
+    return bodies
+
+
+def get_snapshot_paths(basename):
+    root = settings.CATALOG_SNAPSHOT_ROOT
+    if not root:
+        return {}
+    return {
+        encoding: os.path.join(root, basename + extension)
+        for encoding, extension in EXTENSIONS.items()
+    }
+
+
+def write_snapshot_files(basename, bodies):
+    paths = get_snapshot_paths(basename)
+    if paths:
+        os.makedirs(settings.CATALOG_SNAPSHOT_ROOT, exist_ok=True)
+    for encoding, body in bodies.items():
+        path = paths.get(encoding)
+        if path is None:
+            continue
+        temporary = f'{path}.{os.getpid()}.tmp'
+        with open(temporary, 'wb') as file:
+            file.write(body)
+        os.replace(temporary, path)
+
+
+def remove_snapshot_files(basename):
+    for path in get_snapshot_paths(basename).values():
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def get_accepted_encodings(request):
+    encodings = set()
+    for part in request.headers.get('Accept-Encoding', '').split(','):
+        name, _, params = part.partition(';')
+        try:
+            quality = float(params.strip().removeprefix('q=') or 1)
+        except ValueError:
+            continue
+        if quality > 0:
+            encodings.add(name.strip().lower())
+    return encodings
+
+
+class CatalogSnapshotMixin:
+    '''
+    Serves the unfiltered list from a snapshot rebuilt only when one of
+    snapshot_namespaces changes. JSON clients that accept gzip or brotli
+    get the precompressed bytes as is.
+    '''
+
+    snapshot_namespaces = ()
+    snapshots = {}
+    snapshot_lock = Lock()
+
+    def build_snapshot(self, version):
+        data = self.get_serializer(self.get_queryset(), many=True).data
+        bodies = compress(JSONRenderer().render(data))
+        write_snapshot_files(self.basename, bodies)
+        if get_version(*self.snapshot_namespaces) != version:
+            remove_snapshot_files(self.basename)
+        return Snapshot(
+            version=version,
+            etag=f'W/"{self.basename}-{version}"',
+            data=list(data),
+            bodies=bodies,
+        )
+
+    def get_snapshot(self):
+        version = get_version(*self.snapshot_namespaces)
+        snapshot = self.snapshots.get(self.basename)
+        if snapshot is not None and snapshot.version == version:
+            increment_counter(self.basename, HIT)
+            return snapshot, HIT
+        with self.snapshot_lock:
+            snapshot = self.snapshots.get(self.basename)
+            if snapshot is None or snapshot.version != version:
+                snapshot = self.build_snapshot(version)
+                self.snapshots[self.basename] = snapshot
+        increment_counter(self.basename, MISS)
+        return snapshot, MISS
+
+    def get_snapshot_encoding(self, request):
+        if request.accepted_media_type != JSONRenderer.media_type:
+            return None
+        encodings = get_accepted_encodings(request)
+        if brotli is not None and BROTLI in encodings:
+            return BROTLI
+        if GZIP in encodings:
+            return GZIP
+        return None
+
+    def list(self, request, *args, **kwargs):
+        snapshot, state = self.get_snapshot()
+        etags = parse_etags(request.headers.get('If-None-Match', ''))
+        encoding = self.get_snapshot_encoding(request)
+        if snapshot.etag in etags:
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        elif encoding is not None:
+            response = HttpResponse(
+                snapshot.bodies[encoding],
+                content_type=JSONRenderer.media_type,
+            )
+            response['Content-Encoding'] = encoding
+            response['Content-Length'] = len(snapshot.bodies[encoding])
+        else:
+            response = Response(snapshot.data)
+        response['ETag'] = snapshot.etag
+        response['Cache-Control'] = (
+            f'public, max-age={settings.CATALOG_SNAPSHOT_MAX_AGE}'
+        )
+        response[CACHE_HEADER] = state
+        patch_vary_headers(response, ('Accept', 'Accept-Encoding'))
+        return response
@@ -1,8 +1,44 @@
+import csv
+import gzip
+import json
+import subprocess
+import sys
+from base64 import b64encode
+from concurrent.futures import ThreadPoolExecutor
+from hashlib import sha256
+from io import BytesIO, StringIO
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from threading import Barrier
+from unittest import mock, skipUnless
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.uploadedfile import (SimpleUploadedFile,
+                                            TemporaryUploadedFile)
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from reportlab.pdfbase import pdfmetrics
 from rest_framework import status
 from rest_framework.reverse import reverse
-from rest_framework.test import APITestCase
+from rest_framework.test import APIClient, APITestCase, APITransactionTestCase
+
+from users.models import Subscription, User
+
+from .exports import PDFExport
+from .images import (VARIANT_FORMATS, VARIANT_WIDTHS, generate_variants,
+                     generate_variants_in_worker)
+from .models import (Favorite, Ingredient, Recipe, RecipeIngredient,
+                     ShoppingCart, ShoppingListItem, Tag)
+from .versions import (FAVORITES, INGREDIENTS, RECIPES, SUBSCRIPTIONS,
+                       bump_version, get_version, user_namespace)
 
-from .models import Ingredient, Tag
+FILE_CACHE = 'django.core.cache.backends.filebased.FileBasedCache'
+LOCMEM_CACHE = 'django.core.cache.backends.locmem.LocMemCache'
 
 
 class RecipeBaseTestCase(APITestCase):
@@ -23,6 +59,9 @@ class RecipeBaseTestCase(APITestCase):
             [Ingredient(**ingredient) for ingredient in cls.ingredients]
         )
 
+    def setUp(self):
+        cache.clear()
+
 
 class TagsTestCase(RecipeBaseTestCase):
     @classmethod
@@ -98,3 +137,1569 @@ class IngredientsTestCase(RecipeBaseTestCase):
         for key in self.ingredients[0]:
             self.assertIn(key, response.data[0])
         self.assertIn('id', response.data[0])
+
+
+class IngredientSearchTestCase(RecipeBaseTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.url_list = reverse('recipes:ingredient-list')
+
+    def setUp(self):
+        super().setUp()
+        Ingredient.objects.create(name='сок абрикосовый', measurement_unit='г')
+        Ingredient.objects.create(name='Мёд', measurement_unit='г')
+
+    def search(self, name):
+        response = self.client.get(self.url_list, {'name': name})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [ingredient['name'] for ingredient in response.data]
+
+    def test_prefix_matches_first(self):
+        self.assertEqual(
+            self.search('Абрикос'),
+            ['абрикосовый сок', 'абрикосы', 'сок абрикосовый'],
+        )
+        self.assertEqual(self.search('мед'), ['Мёд'])
+
+    def test_no_queries_after_index_is_built(self):
+        self.search('абрикос')
+        with self.assertNumQueries(0):
+            self.search('сок')
+
+    def test_index_rebuilt_on_change(self):
+        self.search('абрикос')
+        with self.captureOnCommitCallbacks(execute=True):
+            Ingredient.objects.create(
+                name='абрикосовый джем', measurement_unit='г'
+            )
+        self.assertIn('абрикосовый джем', self.search('абрикос'))
+
+    def test_large_catalog_searched_in_database(self):
+        with mock.patch('recipes.search.INDEX_SIZE_LIMIT', 1):
+            self.assertEqual(
+                self.search('абрикос'),
+                ['абрикосовый сок', 'абрикосы', 'сок абрикосовый'],
+            )
+
+    def test_database_search_normalized(self):
+        Ingredient.objects.create(name='мёд цветочный', measurement_unit='г')
+        expected = self.search('МЕД Ц')
+        with mock.patch('recipes.search.INDEX_SIZE_LIMIT', 1):
+            bump_version(INGREDIENTS)
+            self.assertEqual(self.search('МЕД Ц'), expected)
+        self.assertEqual(expected, ['мёд цветочный'])
+
+
+class LoadIngredientsTestCase(RecipeBaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.directory = TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.rows = [
+            ('абрикосы', 'г'),
+            ('абрикосы', 'кг'),
+            ('ананас', 'шт'),
+            ('ананас', 'шт'),
+        ]
+
+    def load(self, name, content, *args):
+        path = Path(self.directory.name) / name
+        path.write_text(content, encoding='utf-8')
+        stdout = StringIO()
+        call_command('load_ingredients', str(path), *args, stdout=stdout)
+        return stdout.getvalue()
+
+    def get_ingredients(self):
+        return set(Ingredient.objects.values_list('name', 'measurement_unit'))
+
+    def test_load_csv(self):
+        ingredient = Ingredient.objects.get(name='абрикосы')
+        content = ''.join(f'{name},{unit}\n' for name, unit in self.rows)
+        output = self.load('ingredients.csv', content, '--dry-run')
+        self.assertIn('Будет добавлено ингредиентов: 2 из 4', output)
+        self.assertEqual(Ingredient.objects.count(), len(self.ingredients))
+        output = self.load('ingredients.csv', content, '--batch-size=2')
+        self.assertIn('Добавлено ингредиентов: 2 из 4', output)
+        self.assertEqual(
+            self.get_ingredients(),
+            {
+                ('абрикосы', 'г'),
+                ('абрикосовый сок', 'стакан'),
+                ('абрикосы', 'кг'),
+                ('ананас', 'шт'),
+            },
+        )
+        self.assertTrue(Ingredient.objects.filter(id=ingredient.id))
+
+    def test_dry_run_duplicates_across_batches(self):
+        content = 'ананас,шт\nабрикосы,кг\nананас,шт\n'
+        output = self.load(
+            'ingredients.csv', content, '--dry-run', '--batch-size=2'
+        )
+        self.assertIn('Будет добавлено ингредиентов: 2 из 3', output)
+        self.assertEqual(Ingredient.objects.count(), len(self.ingredients))
+
+    def test_load_json(self):
+        content = json.dumps(
+            [
+                {'name': name, 'measurement_unit': unit}
+                for name, unit in self.rows
+            ],
+            ensure_ascii=False,
+            indent=2,
+        )
+        with mock.patch(
+            'recipes.management.commands.load_ingredients.CHUNK_SIZE', 7
+        ):
+            output = self.load('ingredients.json', content)
+        self.assertIn('Добавлено ингредиентов: 2 из 4', output)
+        self.assertIn(('ананас', 'шт'), self.get_ingredients())
+
+    def test_load_invalid_file(self):
+        for name, content in (
+            ('ingredients.json', '{"name": "ананас"}'),
+            ('ingredients.json', '[{"name": "ананас"'),
+            ('ingredients.csv', 'ананас\n'),
+            ('ingredients.txt', ''),
+        ):
+            with self.subTest(name=name, content=content):
+                with self.assertRaises(CommandError):
+                    self.load(name, content)
+        with self.assertRaises(CommandError):
+            self.load('ingredients.csv', 'ананас,шт\n', '--batch-size=0')
+        self.assertEqual(Ingredient.objects.count(), len(self.ingredients))
+
+
+class RecipeListBaseTestCase(RecipeBaseTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.url_list = reverse('recipes:recipe-list')
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(
+            username='user', email='user@ya.ru', password='Qwerty!2'
+        )
+        self.author = User.objects.create_user(
+            username='author', email='author@ya.ru', password='Qwerty!2'
+        )
+        Subscription.objects.create(user=self.user, author=self.author)
+
+    def _create_recipes(self, count):
+        tags = Tag.objects.all()
+        ingredients = Ingredient.objects.all()
+        with self.captureOnCommitCallbacks(execute=True):
+            for i in range(count):
+                recipe = Recipe.objects.create(
+                    author=self.author,
+                    name=f'Рецепт {i}',
+                    image='recipes/images/image.png',
+                    text='Описание',
+                    cooking_time=10,
+                )
+                recipe.tags.set(tags)
+                RecipeIngredient.objects.bulk_create(
+                    RecipeIngredient(
+                        recipe=recipe, ingredient=item, amount=i + 1
+                    )
+                    for item in ingredients
+                )
+                Favorite.objects.create(user=self.user, recipe=recipe)
+                ShoppingCart.objects.create(user=self.user, recipe=recipe)
+
+
+class RecipeListQueriesTestCase(RecipeListBaseTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.FEW_RECIPES_COUNT = 2
+        cls.RECIPES_COUNT = 8
+
+    def _count_list_queries(self, count):
+        self._create_recipes(count)
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(
+                f'{self.url_list}?limit={self.RECIPES_COUNT}'
+            )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['results']), count)
+        with self.captureOnCommitCallbacks(execute=True):
+            Recipe.objects.all().delete()
+        return len(context.captured_queries)
+
+    def test_list_queries_independent_of_page_size(self):
+        for user in (None, self.user):
+            with self.subTest(user=user):
+                self.client.force_authenticate(user)
+                self.assertEqual(
+                    self._count_list_queries(self.FEW_RECIPES_COUNT),
+                    self._count_list_queries(self.RECIPES_COUNT),
+                )
+
+    def test_list_user_flags(self):
+        self._create_recipes(self.FEW_RECIPES_COUNT)
+        self.client.force_authenticate(self.user)
+        response = self.client.get(self.url_list)
+        for recipe in response.data['results']:
+            self.assertTrue(recipe['is_favorited'])
+            self.assertTrue(recipe['is_in_shopping_cart'])
+            self.assertTrue(recipe['author']['is_subscribed'])
+            self.assertEqual(len(recipe['tags']), len(self.tags))
+            self.assertEqual(len(recipe['ingredients']), len(self.ingredients))
+        response = self.client.get(f'{self.url_list}?is_favorited=1')
+        self.assertEqual(len(response.data['results']), self.FEW_RECIPES_COUNT)
+        self.client.force_authenticate(None)
+        response = self.client.get(f'{self.url_list}?is_favorited=1')
+        self.assertEqual(response.data['count'], 0)
+        response = self.client.get(self.url_list)
+        for recipe in response.data['results']:
+            self.assertFalse(recipe['is_favorited'])
+            self.assertFalse(recipe['author']['is_subscribed'])
+
+
+class RecipeCursorPaginationTestCase(RecipeListBaseTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.RECIPES_COUNT = 7
+        cls.LIMIT_SIZE = 3
+        cls.SAME_DATE_COUNT = 3
+        cls.data_keys = ('next', 'previous', 'results')
+
+    def _walk(self, url, link):
+        pages = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(len(response.data), len(self.data_keys))
+            pages.append([recipe['id'] for recipe in response.data['results']])
+            last_url, url = url, response.data[link]
+        return pages, last_url
+
+    def test_cursor_pages(self):
+        self._create_recipes(self.RECIPES_COUNT)
+        recipe = Recipe.objects.first()
+        Recipe.objects.filter(
+            id__in=Recipe.objects.values('id')[: self.SAME_DATE_COUNT]
+        ).update(pub_date=recipe.pub_date)
+        expected = list(Recipe.objects.values_list('id', flat=True))
+        response = self.client.get(
+            f'{self.url_list}?limit={self.RECIPES_COUNT}'
+        )
+        self.assertEqual(
+            [recipe['id'] for recipe in response.data['results']], expected
+        )
+        pages, last_url = self._walk(
+            f'{self.url_list}?cursor=&limit={self.LIMIT_SIZE}', 'next'
+        )
+        self.assertEqual(sum(pages, []), expected)
+        self.assertTrue(all(len(page) <= self.LIMIT_SIZE for page in pages))
+        pages, _ = self._walk(last_url, 'previous')
+        self.assertEqual(sum(reversed(pages), []), expected)
+
+    def test_cursor_with_ordering(self):
+        self._create_recipes(self.LIMIT_SIZE)
+        response = self.client.get(
+            f'{self.url_list}?cursor=&ordering=-favorited_count'
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('errors', response.data)
+
+    def test_invalid_cursor(self):
+        response = self.client.get(f'{self.url_list}?cursor=invalid')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class RecipeCountTestCase(RecipeListBaseTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.RECIPES_COUNT = 3
+        cls.header = 'X-Count-Strategy'
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.user)
+
+    def _get_count(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data['count'], response[self.header]
+
+    def test_small_count_is_exact(self):
+        self._create_recipes(self.RECIPES_COUNT)
+        for _ in range(2):
+            self.assertEqual(
+                self._get_count(self.url_list), (self.RECIPES_COUNT, 'exact')
+            )
+
+    @mock.patch('recipes.counts.EXACT_COUNT_LIMIT', 1)
+    def test_large_count_is_cached(self):
+        self._create_recipes(self.RECIPES_COUNT)
+        url = f'{self.url_list}?tags=breakfast'
+        self.assertEqual(self._get_count(url), (self.RECIPES_COUNT, 'exact'))
+        self.assertEqual(self._get_count(url), (self.RECIPES_COUNT, 'cached'))
+        with self.captureOnCommitCallbacks(execute=True):
+            Recipe.objects.first().delete()
+        self.assertEqual(
+            self._get_count(url), (self.RECIPES_COUNT - 1, 'exact')
+        )
+
+    def test_empty_result_count(self):
+        self._create_recipes(self.RECIPES_COUNT)
+        self.client.force_authenticate(None)
+        self.assertEqual(
+            self._get_count(f'{self.url_list}?is_favorited=1'), (0, 'exact')
+        )
+
+
+class AnonymousCacheTestCase(RecipeListBaseTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.RECIPES_COUNT = 3
+        cls.header = 'X-Cache'
+        cls.url_tags = reverse('recipes:tag-list')
+
+    def test_recipe_list_cache(self):
+        self._create_recipes(self.RECIPES_COUNT)
+        urls = (
+            f'{self.url_list}?limit=2&tags=lunch&tags=breakfast',
+            f'{self.url_list}?tags=breakfast&limit=2&tags=lunch',
+        )
+        response = self.client.get(urls[0])
+        self.assertEqual(response[self.header], 'MISS')
+        response = self.client.get(urls[1])
+        self.assertEqual(response[self.header], 'HIT')
+        self.assertEqual(response.data['count'], self.RECIPES_COUNT)
+        self._create_recipes(1)
+        response = self.client.get(urls[0])
+        self.assertEqual(response[self.header], 'MISS')
+        self.assertEqual(response.data['count'], self.RECIPES_COUNT + 1)
+        self.client.force_authenticate(self.user)
+        response = self.client.get(urls[0])
+        self.assertFalse(response.has_header(self.header))
+
+    def test_recipe_list_author_change(self):
+        self._create_recipes(1)
+        self.client.get(self.url_list)
+        self.assertEqual(self.client.get(self.url_list)[self.header], 'HIT')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.author.first_name = 'Новое имя'
+            self.author.save()
+        response = self.client.get(self.url_list)
+        self.assertEqual(response[self.header], 'MISS')
+        self.assertEqual(
+            response.data['results'][0]['author']['first_name'], 'Новое имя'
+        )
+
+    def test_cache_stats(self):
+        with TemporaryDirectory() as location:
+            with self.settings(
+                CACHES={
+                    'default': {
+                        'BACKEND': FILE_CACHE,
+                        'LOCATION': location,
+                    }
+                }
+            ):
+                self.client.get(self.url_tags)
+                self.client.get(self.url_tags)
+                stdout = StringIO()
+                call_command('response_cache_stats', stdout=stdout)
+        self.assertIn('tag: hits=1, misses=1', stdout.getvalue())
+        with self.settings(CACHES={'default': {'BACKEND': LOCMEM_CACHE}}):
+            with self.assertRaises(CommandError):
+                call_command('response_cache_stats', stdout=StringIO())
+
+    def test_tag_list_cache(self):
+        response = self.client.get(self.url_tags)
+        self.assertEqual(response[self.header], 'MISS')
+        response = self.client.get(self.url_tags)
+        self.assertEqual(response[self.header], 'HIT')
+        with self.captureOnCommitCallbacks(execute=True):
+            Tag.objects.create(name='Перекус', slug='snack')
+        response = self.client.get(self.url_tags)
+        self.assertEqual(response[self.header], 'MISS')
+        self.assertEqual(len(response.data), len(self.tags) + 1)
+
+
+class CatalogSnapshotTestCase(RecipeBaseTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.url_tags = reverse('recipes:tag-list')
+        cls.url_ingredients = reverse('recipes:ingredient-list')
+
+    def test_gzip_snapshot(self):
+        plain = self.client.get(self.url_ingredients)
+        self.assertEqual(plain.status_code, status.HTTP_200_OK)
+        self.assertFalse(plain.has_header('Content-Encoding'))
+        with self.assertNumQueries(0):
+            response = self.client.get(
+                self.url_ingredients, HTTP_ACCEPT_ENCODING='gzip, deflate'
+            )
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['ETag'], plain['ETag'])
+        self.assertIn('max-age', response['Cache-Control'])
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(
+            json.loads(gzip.decompress(response.content)), plain.data
+        )
+
+    def test_snapshot_not_modified(self):
+        response = self.client.get(self.url_tags)
+        response = self.client.get(
+            self.url_tags, HTTP_IF_NONE_MATCH=response['ETag']
+        )
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        with self.captureOnCommitCallbacks(execute=True):
+            Tag.objects.create(name='Перекус', slug='snack')
+        response = self.client.get(
+            self.url_tags, HTTP_IF_NONE_MATCH=response['ETag']
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data), len(self.tags) + 1)
+
+    def test_version_bumped_by_other_process(self):
+        self.client.get(self.url_ingredients)
+        self.client.get(self.url_ingredients, {'name': 'мед'})
+        # bulk_create sends no signals, the version stays the same
+        Ingredient.objects.bulk_create(
+            [Ingredient(name='мед', measurement_unit='г')]
+        )
+        subprocess.run(
+            [
+                sys.executable,
+                settings.BASE_DIR / 'manage.py',
+                'shell',
+                '-c',
+                'from recipes.versions import INGREDIENTS, bump_version; '
+                'bump_version(INGREDIENTS)',
+            ],
+            check=True,
+        )
+        for params in ({}, {'name': 'мед'}):
+            with self.subTest(params=params):
+                response = self.client.get(self.url_ingredients, params)
+                self.assertIn(
+                    'мед', [ingredient['name'] for ingredient in response.data]
+                )
+
+    def test_snapshot_files(self):
+        with (
+            TemporaryDirectory() as root,
+            self.settings(CATALOG_SNAPSHOT_ROOT=root),
+        ):
+            path = Path(root) / 'ingredient.json.gz'
+            self.client.get(self.url_ingredients)
+            self.assertEqual(
+                json.loads(gzip.decompress(path.read_bytes())),
+                self.client.get(self.url_ingredients).data,
+            )
+            Ingredient.objects.create(name='мед', measurement_unit='г')
+            self.assertFalse(path.exists())
+
+
+class ConditionalGetTestCase(RecipeListBaseTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.RECIPES_COUNT = 2
+
+    def setUp(self):
+        super().setUp()
+        self._create_recipes(self.RECIPES_COUNT)
+        self.recipe = Recipe.objects.first()
+        self.url_detail = reverse(
+            'recipes:recipe-detail', kwargs={'pk': self.recipe.id}
+        )
+        self.client.force_authenticate(self.user)
+
+    def _assert_not_modified(self, url, etag, expected=True):
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        if expected:
+            self.assertEqual(
+                response.status_code, status.HTTP_304_NOT_MODIFIED
+            )
+            self.assertEqual(response.content, b'')
+        else:
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response['ETag']
+
+    def test_validators(self):
+        for url in (self.url_list, self.url_detail):
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                self.assertEqual(
+                    'Last-Modified' in response, url == self.url_detail
+                )
+                self.assertEqual(
+                    self._assert_not_modified(url, response['ETag']),
+                    response['ETag'],
+                )
+
+    def test_recipe_change(self):
+        for url in (self.url_list, self.url_detail):
+            with self.subTest(url=url):
+                etag = self.client.get(url)['ETag']
+                with self.captureOnCommitCallbacks(execute=True):
+                    self.recipe.save()
+                self._assert_not_modified(url, etag, expected=False)
+
+    def test_author_change(self):
+        for url in (self.url_list, self.url_detail):
+            with self.subTest(url=url):
+                etag = self.client.get(url)['ETag']
+                with self.captureOnCommitCallbacks(execute=True):
+                    self.author.first_name = f'Новое имя {url}'
+                    self.author.save()
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_user_state_change(self):
+        for url in (self.url_list, self.url_detail):
+            with self.subTest(url=url):
+                etag = self.client.get(url)['ETag']
+                with self.captureOnCommitCallbacks(execute=True):
+                    Favorite.objects.get(
+                        user=self.user, recipe=self.recipe
+                    ).delete()
+                etag = self._assert_not_modified(url, etag, expected=False)
+                with self.captureOnCommitCallbacks(execute=True):
+                    Favorite.objects.create(user=self.user, recipe=self.recipe)
+                etag = self._assert_not_modified(url, etag, expected=False)
+                with self.captureOnCommitCallbacks(execute=True):
+                    Subscription.objects.get(user=self.user).delete()
+                etag = self._assert_not_modified(url, etag, expected=False)
+                with self.captureOnCommitCallbacks(execute=True):
+                    Subscription.objects.create(
+                        user=self.user, author=self.author
+                    )
+                self._assert_not_modified(url, etag, expected=False)
+
+    def test_list_validator_queries(self):
+        self.client.force_authenticate(None)
+        self.client.get(self.url_list)
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url_list)
+        self.assertEqual(
+            self._assert_not_modified(self.url_list, response['ETag']),
+            response['ETag'],
+        )
+
+    def test_other_user_etag(self):
+        etag = self.client.get(self.url_detail)['ETag']
+        self.client.force_authenticate(self.author)
+        self._assert_not_modified(self.url_detail, etag, expected=False)
+
+    def test_versions_bumped_on_commit(self):
+        subscriptions = user_namespace(SUBSCRIPTIONS, self.user.id)
+        for namespace, change in (
+            (RECIPES, self.recipe.save),
+            (FAVORITES, Favorite.objects.filter(user=self.user).delete),
+            (
+                subscriptions,
+                Subscription.objects.filter(user=self.user).delete,
+            ),
+        ):
+            with self.subTest(namespace=namespace):
+                version = get_version(namespace)
+                with self.captureOnCommitCallbacks(execute=True):
+                    change()
+                    self.assertEqual(get_version(namespace), version)
+                self.assertNotEqual(get_version(namespace), version)
+
+
+class FavoritedCountTestCase(RecipeListBaseTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.RECIPES_COUNT = 3
+
+    def setUp(self):
+        super().setUp()
+        self._create_recipes(self.RECIPES_COUNT)
+        self.recipe = Recipe.objects.last()
+        self.url_favorite = reverse(
+            'recipes:recipe-favorite', kwargs={'pk': self.recipe.id}
+        )
+
+    def _get_favorited_count(self):
+        self.recipe.refresh_from_db()
+        return self.recipe.favorited_count
+
+    def test_favorite_action(self):
+        self.assertEqual(self._get_favorited_count(), 1)
+        self.client.force_authenticate(self.author)
+        response = self.client.post(self.url_favorite)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(self._get_favorited_count(), 2)
+        response = self.client.delete(self.url_favorite)
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(self._get_favorited_count(), 1)
+        self.user.delete()
+        self.assertEqual(self._get_favorited_count(), 0)
+
+    def test_recipes_count(self):
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.recipes_count, self.RECIPES_COUNT)
+        self.recipe.delete()
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.recipes_count, self.RECIPES_COUNT - 1)
+
+    def test_recount(self):
+        Recipe.objects.update(favorited_count=10)
+        User.objects.update(recipes_count=10)
+        call_command('recount_counters', stdout=StringIO())
+        self.assertEqual(self._get_favorited_count(), 1)
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.recipes_count, self.RECIPES_COUNT)
+
+    def test_ordering_by_favorited_count(self):
+        Favorite.objects.create(user=self.author, recipe=self.recipe)
+        response = self.client.get(
+            f'{self.url_list}?ordering=-favorited_count'
+        )
+        results = response.data['results']
+        self.assertEqual(results[0]['id'], self.recipe.id)
+        self.assertEqual(results[0]['favorited_count'], 2)
+
+
+class RecipeTagsFilterTestCase(RecipeListBaseTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.RECIPES_COUNT = 3
+
+    def test_tags_filter(self):
+        self._create_recipes(self.RECIPES_COUNT)
+        recipe = Recipe.objects.first()
+        recipe.tags.set(Tag.objects.filter(slug='dinner'))
+        urls = {
+            f'{self.url_list}?tags=breakfast&tags=lunch': (
+                self.RECIPES_COUNT - 1
+            ),
+            f'{self.url_list}?tags=breakfast&tags=lunch&tags=dinner': (
+                self.RECIPES_COUNT
+            ),
+            f'{self.url_list}?tags=dinner': self.RECIPES_COUNT,
+        }
+        for url, count in urls.items():
+            with self.subTest(url=url):
+                with CaptureQueriesContext(connection) as context:
+                    response = self.client.get(url)
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                self.assertEqual(response.data['count'], count)
+                ids = [item['id'] for item in response.data['results']]
+                self.assertEqual(len(ids), len(set(ids)))
+                for query in context.captured_queries:
+                    self.assertNotIn('DISTINCT', query['sql'])
+
+
+class ShoppingListDownloadTestCase(RecipeListBaseTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.url_download = reverse('recipes:recipe-download-shopping-cart')
+
+    def setUp(self):
+        super().setUp()
+        self._create_recipes(2)
+        self.client.force_authenticate(self.user)
+
+    def download(self, **params):
+        response = self.client.get(self.url_download, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return b''.join(response.streaming_content).decode()
+
+    def test_download_formats(self):
+        self.assertEqual(
+            self.download(),
+            'Список покупок:\n'
+            'Абрикосовый сок (стакан) - 3 \n'
+            'Абрикосы (г) - 3 \n',
+        )
+        self.assertEqual(
+            list(csv.reader(StringIO(self.download(format='csv')))),
+            [
+                ['Ингредиент', 'Единица измерения', 'Количество'],
+                ['абрикосовый сок', 'стакан', '3'],
+                ['абрикосы', 'г', '3'],
+            ],
+        )
+        response = self.client.get(self.url_download, {'format': 'doc'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('errors', response.data)
+
+    @skipUnless(
+        Path(settings.SHOPPING_LIST_PDF_FONT).is_file(),
+        'fonts-dejavu-core is not installed',
+    )
+    def test_download_pdf(self):
+        response = self.client.get(self.url_download, {'format': 'pdf'})
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        content = b''.join(response.streaming_content)
+        self.assertTrue(content.startswith(b'%PDF'))
+        face = pdfmetrics.getFont(PDFExport.font_name).face
+        self.assertIn(b'/BaseFont /AAAAAA+' + face.name, content)
+
+    @override_settings(SHOPPING_LIST_PDF_FONT='/nonexistent/font.ttf')
+    def test_download_pdf_without_font(self):
+        response = self.client.get(self.url_download, {'format': 'pdf'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(
+            response.data['errors'], 'Доступные форматы: txt, csv.'
+        )
+
+    def test_download_empty_cart(self):
+        ShoppingCart.objects.all().delete()
+        response = self.client.get(self.url_download)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_download_queries(self):
+        with self.assertNumQueries(1):
+            self.download()
+
+    def get_shopping_list(self):
+        return dict(
+            ShoppingListItem.objects.filter(user=self.user).values_list(
+                'ingredient__name', 'amount'
+            )
+        )
+
+    def test_shopping_list_maintained(self):
+        recipe = Recipe.objects.first()
+        url = reverse('recipes:recipe-shopping-cart', args=(recipe.id,))
+        self.assertEqual(
+            self.get_shopping_list(), {'абрикосы': 3, 'абрикосовый сок': 3}
+        )
+        item = recipe.recipe_ingredients.get(ingredient__name='абрикосы')
+        item.amount += 10
+        item.save()
+        self.assertEqual(self.get_shopping_list()['абрикосы'], 13)
+        response = self.client.delete(url)
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        other = Recipe.objects.exclude(id=recipe.id).get()
+        self.assertEqual(
+            self.get_shopping_list(),
+            dict(
+                other.recipe_ingredients.values_list(
+                    'ingredient__name', 'amount'
+                )
+            ),
+        )
+        self.client.post(url)
+        other.delete()
+        self.assertEqual(
+            self.get_shopping_list(),
+            {'абрикосы': item.amount, 'абрикосовый сок': 2},
+        )
+        self.assertEqual(
+            self.download().splitlines()[1:],
+            [
+                'Абрикосовый сок (стакан) - 2 ',
+                f'Абрикосы (г) - {item.amount} ',
+            ],
+        )
+
+    def test_rebuild_shopping_lists(self):
+        expected = self.get_shopping_list()
+        ShoppingListItem.objects.update(amount=1)
+        ShoppingListItem.objects.create(
+            user=self.author, ingredient=Ingredient.objects.first(), amount=1
+        )
+        call_command('rebuild_shopping_lists', stdout=StringIO())
+        self.assertEqual(self.get_shopping_list(), expected)
+        self.assertFalse(ShoppingListItem.objects.filter(user=self.author))
+
+
+class BulkRelationsTestCase(RecipeListBaseTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.url_favorite = reverse('recipes:recipe-bulk-favorite')
+        cls.url_shopping_cart = reverse('recipes:recipe-bulk-shopping-cart')
+        cls.NON_EXIST_RECIPE_ID = 999
+
+    def setUp(self):
+        super().setUp()
+        self._create_recipes(2)
+        self.ids = list(
+            Recipe.objects.order_by('id').values_list('id', flat=True)
+        )
+        self.client.force_authenticate(self.author)
+
+    def get_statuses(self, method, url, ids):
+        response = method(url, {'ids': ids}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [result['status'] for result in response.data['results']]
+
+    def test_bulk_favorite(self):
+        first, second = self.ids
+        self.client.post(reverse('recipes:recipe-favorite', args=(first,)))
+        ids = [first, second, second, self.NON_EXIST_RECIPE_ID]
+        self.assertEqual(
+            self.get_statuses(self.client.post, self.url_favorite, ids),
+            ['exists', 'created', 'not_found'],
+        )
+        self.assertEqual(
+            dict(Recipe.objects.values_list('id', 'favorited_count')),
+            {first: 2, second: 2},
+        )
+        self.assertEqual(
+            self.get_statuses(
+                self.client.delete, self.url_favorite, [second, second]
+            ),
+            ['deleted'],
+        )
+        self.assertEqual(
+            self.get_statuses(
+                self.client.delete, self.url_favorite, [first, second]
+            ),
+            ['deleted', 'missing'],
+        )
+        self.assertEqual(
+            dict(Recipe.objects.values_list('id', 'favorited_count')),
+            {first: 1, second: 1},
+        )
+
+    def test_bulk_shopping_cart(self):
+        self.assertEqual(
+            self.get_statuses(
+                self.client.post, self.url_shopping_cart, self.ids
+            ),
+            ['created', 'created'],
+        )
+        self.assertEqual(
+            dict(
+                ShoppingListItem.objects.filter(user=self.author).values_list(
+                    'ingredient__name', 'amount'
+                )
+            ),
+            {'абрикосы': 3, 'абрикосовый сок': 3},
+        )
+        self.get_statuses(
+            self.client.delete, self.url_shopping_cart, self.ids[:1]
+        )
+        self.assertEqual(
+            dict(
+                ShoppingListItem.objects.filter(user=self.author).values_list(
+                    'ingredient__name', 'amount'
+                )
+            ),
+            {'абрикосы': 2, 'абрикосовый сок': 2},
+        )
+
+    def test_bulk_invalid_ids(self):
+        for ids in ([], [0], ['a'], list(range(1, 102))):
+            with self.subTest(ids=ids):
+                response = self.client.post(
+                    self.url_favorite, {'ids': ids}, format='json'
+                )
+                self.assertEqual(
+                    response.status_code, status.HTTP_400_BAD_REQUEST
+                )
+        self.client.force_authenticate(None)
+        response = self.client.post(
+            self.url_favorite, {'ids': self.ids}, format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class DataTransferTestCase(RecipeListBaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self._create_recipes(2)
+        self.directory = TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.path = str(Path(self.directory.name) / 'data.ndjson')
+
+    def get_state(self):
+        return {
+            'users': sorted(
+                User.objects.values_list(
+                    'username', 'password', 'recipes_count'
+                )
+            ),
+            'recipes': sorted(
+                Recipe.objects.values_list(
+                    'author__username', 'name', 'pub_date', 'favorited_count'
+                )
+            ),
+            'tags': sorted(
+                Recipe.tags.through.objects.values_list(
+                    'recipe__name', 'tag__slug'
+                )
+            ),
+            'ingredients': sorted(
+                RecipeIngredient.objects.values_list(
+                    'recipe__name', 'ingredient__name', 'amount'
+                )
+            ),
+            'subscriptions': sorted(
+                Subscription.objects.values_list(
+                    'user__username', 'author__username'
+                )
+            ),
+            'favorites': sorted(
+                Favorite.objects.values_list('user__username', 'recipe__name')
+            ),
+            'shopping_list': sorted(
+                ShoppingListItem.objects.values_list(
+                    'user__username', 'ingredient__name', 'amount'
+                )
+            ),
+        }
+
+    def test_export_import(self):
+        expected = self.get_state()
+        call_command('export_data', self.path, stdout=StringIO())
+        User.objects.all().delete()
+        Tag.objects.all().delete()
+        call_command('import_data', self.path, stdout=StringIO())
+        self.assertEqual(self.get_state(), expected)
+        self.assertEqual(Tag.objects.count(), len(self.tags))
+        self.assertEqual(Ingredient.objects.count(), len(self.ingredients))
+
+    def test_import_reuses_users(self):
+        call_command('export_data', self.path, stdout=StringIO())
+        stdout = StringIO()
+        call_command('import_data', self.path, stdout=stdout)
+        self.assertIn(
+            'tag 0, ingredient 0, user 0, recipe 2, subscription 0, '
+            'favorite 2, shopping_cart 2',
+            stdout.getvalue(),
+        )
+        self.assertEqual(User.objects.count(), 2)
+        self.assertEqual(Recipe.objects.count(), 4)
+        self.assertEqual(Favorite.objects.count(), 4)
+
+    def test_import_invalid_file(self):
+        path = Path(self.path)
+        for content in ('{"type": "comment"}', 'null', '{"type": "tag"}'):
+            with self.subTest(content=content):
+                path.write_text(content)
+                with self.assertRaises(CommandError):
+                    call_command('import_data', self.path, stdout=StringIO())
+
+
+class GenerateDatasetTestCase(RecipeBaseTestCase):
+    def get_state(self):
+        return {
+            'recipes': sorted(
+                Recipe.objects.values_list(
+                    'name', 'author__username', 'favorited_count'
+                )
+            ),
+            'ingredients': sorted(
+                RecipeIngredient.objects.values_list(
+                    'recipe__name', 'ingredient__name', 'amount'
+                )
+            ),
+            'favorites': sorted(
+                Favorite.objects.values_list('user__username', 'recipe__name')
+            ),
+        }
+
+    def generate(self, seed):
+        with transaction.atomic():
+            call_command(
+                'generate_dataset',
+                '--recipes=50',
+                '--users=10',
+                f'--seed={seed}',
+                '--batch-size=7',
+                stdout=StringIO(),
+            )
+            self.assertEqual(User.objects.count(), 10)
+            for user in User.objects.all():
+                self.assertEqual(user.recipes_count, user.recipes.count())
+            for recipe in Recipe.objects.all():
+                self.assertEqual(
+                    recipe.favorited_count, recipe.favorite.count()
+                )
+            self.assertFalse(Subscription.objects.filter(user=F('author')))
+            try:
+                return self.get_state()
+            finally:
+                transaction.set_rollback(True)
+
+    def test_generate_dataset(self):
+        state = self.generate(1)
+        self.assertEqual(len(state['recipes']), 50)
+        self.assertTrue(state['ingredients'])
+        self.assertEqual(self.generate(1), state)
+        self.assertNotEqual(self.generate(2), state)
+
+    def test_existing_prefix(self):
+        User.objects.create(username='dataset0')
+        with self.assertRaises(CommandError):
+            call_command('generate_dataset', '--recipes=1', stdout=StringIO())
+
+    def test_invalid_options(self):
+        for options in (
+            ['--users=0'],
+            ['--recipes=0'],
+            ['--recipes=-1', '--favorites=0', '--carts=0'],
+            ['--batch-size=0'],
+            ['--zipf=-1'],
+            ['--subscriptions=-1'],
+        ):
+            with self.subTest(options=options):
+                with self.assertRaises(CommandError):
+                    call_command(
+                        'generate_dataset', *options, stdout=StringIO()
+                    )
+        self.assertFalse(User.objects.filter(username__startswith='dataset'))
+
+    def test_no_recipes(self):
+        call_command(
+            'generate_dataset',
+            '--recipes=0',
+            '--favorites=0',
+            '--carts=0',
+            stdout=StringIO(),
+        )
+        self.assertEqual(User.objects.filter(username='dataset0').count(), 1)
+        self.assertFalse(Recipe.objects.exists())
+
+
+class BenchmarkTestCase(RecipeBaseTestCase):
+    def test_benchmark_report(self):
+        directory = TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = Path(directory.name) / 'report.json'
+        call_command(
+            'benchmark_api',
+            '--sizes=20',
+            '--page-sizes=2',
+            '--repeat=2',
+            f'--output={path}',
+            stderr=StringIO(),
+        )
+        report = json.loads(path.read_text())
+        scenarios = {
+            result['scenario']: result for result in report['results']
+        }
+        self.assertIn('recipes_tags_3', scenarios)
+        self.assertIn('download_shopping_cart', scenarios)
+        for result in report['results']:
+            self.assertEqual(result['status'], status.HTTP_200_OK)
+            self.assertIn('p95', result['latency_ms'])
+            self.assertGreater(result['peak_memory_kb'], 0)
+        self.assertFalse(Recipe.objects.exists())
+        self.assertFalse(User.objects.exists())
+
+
+class RecipeWriteTestCase(RecipeListBaseTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # Validation: ingredients and tags. Write: savepoint, recipe,
+        # author's recipes_count, recipe tags, recipe ingredients,
+        # release. Response: tags, subscriptions, ingredients, favorite,
+        # shopping cart, amounts.
+        cls.CREATE_QUERIES = 14
+        cls.media_root = TemporaryDirectory()
+        media_root = override_settings(MEDIA_ROOT=cls.media_root.name)
+        media_root.enable()
+        cls.addClassCleanup(media_root.disable)
+        cls.addClassCleanup(cls.media_root.cleanup)
+        buffer = BytesIO()
+        Image.new('RGB', (2, 2)).save(buffer, 'PNG')
+        cls.image_content = buffer.getvalue()
+        cls.image = (
+            'data:image/png;base64,' + b64encode(cls.image_content).decode()
+        )
+        Ingredient.objects.bulk_create(
+            Ingredient(name=f'ингредиент {i}', measurement_unit='г')
+            for i in range(30)
+        )
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.author)
+
+    def _get_data(self, ingredients_count):
+        ingredients = Ingredient.objects.all()[:ingredients_count]
+        return {
+            'ingredients': [
+                {'id': ingredient.id, 'amount': 10}
+                for ingredient in ingredients
+            ],
+            'tags': list(Tag.objects.values_list('id', flat=True)),
+            'image': self.image,
+            'name': 'Рецепт',
+            'text': 'Описание',
+            'cooking_time': 10,
+        }
+
+    def test_create_queries(self):
+        for ingredients_count in (1, 30):
+            data = self._get_data(ingredients_count)
+            with self.subTest(ingredients_count=ingredients_count):
+                with self.assertNumQueries(self.CREATE_QUERIES):
+                    response = self.client.post(self.url_list, data)
+                self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+                self.assertEqual(
+                    len(response.data['ingredients']), ingredients_count
+                )
+
+    def test_create_is_atomic(self):
+        with mock.patch.object(
+            RecipeIngredient.objects, 'bulk_create', side_effect=IntegrityError
+        ):
+            with self.assertRaises(IntegrityError):
+                self.client.post(self.url_list, self._get_data(3))
+        self.assertFalse(Recipe.objects.exists())
+
+    def test_create_unknown_ingredient(self):
+        data = self._get_data(1)
+        data['ingredients'].append({'id': 1000, 'amount': 1})
+        response = self.client.post(self.url_list, data)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('errors', response.data)
+
+    def test_create_invalid_tags(self):
+        tag = Tag.objects.first()
+        for tags in ([], [tag.id, tag.id]):
+            data = self._get_data(1)
+            data['tags'] = tags
+            with self.subTest(tags=tags):
+                response = self.client.post(self.url_list, data)
+                self.assertEqual(
+                    response.status_code, status.HTTP_400_BAD_REQUEST
+                )
+        self.assertFalse(Recipe.objects.exists())
+
+    def test_partial_update_keeps_ingredients(self):
+        response = self.client.post(self.url_list, self._get_data(3))
+        url = reverse('recipes:recipe-detail', args=(response.data['id'],))
+        response = self.client.patch(url, {'name': 'Новое название'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['name'], 'Новое название')
+        self.assertEqual(len(response.data['ingredients']), 3)
+
+    def test_full_update(self):
+        response = self.client.post(self.url_list, self._get_data(3))
+        url = reverse('recipes:recipe-detail', args=(response.data['id'],))
+        data = self._get_data(2)
+        data['name'] = 'Новое название'
+        data['tags'] = data['tags'][:1]
+        response = self.client.put(url, data)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['name'], 'Новое название')
+        self.assertEqual(len(response.data['ingredients']), 2)
+        self.assertEqual(len(response.data['tags']), 1)
+        self.assertEqual(Recipe.objects.count(), 1)
+        self.assertEqual(RecipeIngredient.objects.count(), 2)
+
+    def _get_ingredient_writes(self, url, ingredients):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.patch(url, {'ingredients': ingredients})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return sorted(
+            query['sql'].split()[0]
+            for query in context.captured_queries
+            if 'recipes_recipeingredient' in query['sql']
+            and not query['sql'].startswith('SELECT')
+        )
+
+    def test_update_ingredients_diff(self):
+        data = self._get_data(4)
+        response = self.client.post(self.url_list, data)
+        url = reverse('recipes:recipe-detail', args=(response.data['id'],))
+        ShoppingCart.objects.create(
+            user=self.author, recipe_id=response.data['id']
+        )
+        ingredients = data['ingredients']
+        kept = RecipeIngredient.objects.get(
+            ingredient_id=ingredients[2]['id']
+        ).id
+        self.assertEqual(self._get_ingredient_writes(url, ingredients), [])
+        ingredients = [
+            {'id': ingredients[0]['id'], 'amount': 20},
+            ingredients[2],
+            {'id': Ingredient.objects.last().id, 'amount': 5},
+        ]
+        self.assertEqual(
+            self._get_ingredient_writes(url, ingredients),
+            ['DELETE', 'INSERT', 'UPDATE'],
+        )
+        self.assertEqual(
+            dict(
+                RecipeIngredient.objects.values_list('ingredient_id', 'amount')
+            ),
+            {item['id']: item['amount'] for item in ingredients},
+        )
+        self.assertTrue(RecipeIngredient.objects.filter(id=kept).exists())
+        self.assertEqual(
+            dict(
+                ShoppingListItem.objects.values_list('ingredient_id', 'amount')
+            ),
+            {item['id']: item['amount'] for item in ingredients},
+        )
+
+    def test_create_multipart(self):
+        data = self._get_data(3)
+        data['ingredients'] = json.dumps(data['ingredients'])
+        data['image'] = SimpleUploadedFile(
+            'image.png', self.image_content, 'image/png'
+        )
+        response = self.client.post(self.url_list, data, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(response.data['ingredients']), 3)
+        self.assertEqual(len(response.data['tags']), len(self.tags))
+
+    def test_image_limits(self):
+        limits = {
+            'RECIPE_IMAGE_MAX_SIZE': len(self.image_content) - 1,
+            'RECIPE_IMAGE_MAX_PIXELS': 3,
+        }
+        for setting, value in limits.items():
+            for image in (
+                self.image,
+                SimpleUploadedFile('image.png', self.image_content),
+            ):
+                data = self._get_data(1)
+                data['ingredients'] = json.dumps(data['ingredients'])
+                data['image'] = image
+                with self.subTest(setting=setting, image=type(image)):
+                    with self.settings(**{setting: value}):
+                        response = self.client.post(
+                            self.url_list, data, format='multipart'
+                        )
+                    self.assertEqual(
+                        response.status_code, status.HTTP_400_BAD_REQUEST
+                    )
+                    self.assertIn('image', response.data)
+        self.assertFalse(Recipe.objects.exists())
+
+    def test_invalid_base64_image(self):
+        encoded = b64encode(self.image_content).decode()
+        end = 8
+        data = self._get_data(1)
+        data['image'] = (
+            'data:image/png;base64,' + encoded[:end] + '****' + encoded[end:]
+        )
+        response = self.client.post(self.url_list, data)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('image', response.data)
+        self.assertFalse(Recipe.objects.exists())
+
+    def test_decoded_image_closed(self):
+        close = TemporaryUploadedFile.close
+        with mock.patch.object(
+            TemporaryUploadedFile, 'close', autospec=True, side_effect=close
+        ) as mocked:
+            response = self.client.post(self.url_list, self._get_data(1))
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        mocked.assert_called_once()
+
+    def test_image_variants(self):
+        with mock.patch('recipes.images.executor') as executor:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post(self.url_list, self._get_data(1))
+        recipe = Recipe.objects.get(id=response.data['id'])
+        self.assertEqual(response.data['image_variants'], {})
+        executor.submit.assert_called_once_with(
+            generate_variants_in_worker, recipe.id, recipe.image.name
+        )
+        generate_variants(recipe.id, recipe.image.name)
+        url = reverse('recipes:recipe-detail', args=(recipe.id,))
+        variants = self.client.get(url).data['image_variants']
+        self.assertEqual(set(variants), set(VARIANT_WIDTHS))
+        for formats in variants.values():
+            self.assertEqual(set(formats), set(VARIANT_FORMATS))
+            for url in formats.values():
+                path = url.removeprefix('http://testserver/media/')
+                self.assertTrue(
+                    Path(self.media_root.name, path).exists(), path
+                )
+
+    def test_identical_images_share_file(self):
+        images = Path(self.media_root.name, 'recipes', 'images')
+        names = set()
+        for _ in range(2):
+            response = self.client.post(self.url_list, self._get_data(1))
+            names.add(Recipe.objects.get(id=response.data['id']).image.name)
+        self.assertEqual(len(names), 1)
+        name = names.pop()
+        self.assertEqual(
+            Path(name).stem, sha256(self.image_content).hexdigest()
+        )
+        self.assertEqual(
+            [path.name for path in images.iterdir() if path.is_file()],
+            [Path(name).name],
+        )
+
+    def test_collect_orphan_images(self):
+        response = self.client.post(self.url_list, self._get_data(1))
+        images = Path(self.media_root.name, 'recipes', 'images')
+        orphan = images / 'orphan.png'
+        orphan.write_bytes(self.image_content)
+        referenced = Path(
+            self.media_root.name,
+            Recipe.objects.get(id=response.data['id']).image.name,
+        )
+        for options, exists in (
+            ({'dry_run': True, 'older_than': 0}, True),
+            ({}, True),
+            ({'older_than': 0}, False),
+        ):
+            with self.subTest(options=options):
+                call_command(
+                    'collect_orphan_images', stdout=StringIO(), **options
+                )
+                self.assertEqual(orphan.exists(), exists)
+                self.assertTrue(referenced.exists())
+
+
+class RelationToggleConcurrencyTestCase(APITransactionTestCase):
+    THREADS = 8
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='user', email='user@ya.ru', password='Qwerty!2'
+        )
+        self.author = User.objects.create_user(
+            username='author', email='author@ya.ru', password='Qwerty!2'
+        )
+        self.recipe = Recipe.objects.create(
+            author=self.author,
+            name='Рецепт',
+            image='recipes/images/image.png',
+            text='Описание',
+            cooking_time=10,
+        )
+
+    def hammer(self, method, url):
+        barrier = Barrier(self.THREADS)
+
+        def request():
+            client = APIClient()
+            client.force_authenticate(self.user)
+            barrier.wait()
+            try:
+                return getattr(client, method)(url).status_code
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(self.THREADS) as executor:
+            futures = [executor.submit(request) for _ in range(self.THREADS)]
+            return sorted(future.result() for future in futures)
+
+    def get_urls(self, recipe_id=None, author_id=None):
+        recipe_id = recipe_id or self.recipe.id
+        return {
+            Favorite: reverse('recipes:recipe-favorite', args=(recipe_id,)),
+            ShoppingCart: reverse(
+                'recipes:recipe-shopping-cart', args=(recipe_id,)
+            ),
+            Subscription: reverse(
+                'users:user-subscribe', args=(author_id or self.author.id,)
+            ),
+        }
+
+    def test_toggles(self):
+        self.client.force_authenticate(self.user)
+        for model, url in self.get_urls().items():
+            for method, statuses in (
+                (
+                    'post',
+                    [status.HTTP_201_CREATED, status.HTTP_400_BAD_REQUEST],
+                ),
+                (
+                    'delete',
+                    [status.HTTP_204_NO_CONTENT, status.HTTP_400_BAD_REQUEST],
+                ),
+            ):
+                with self.subTest(model=model.__name__, method=method):
+                    self.assertEqual(
+                        [
+                            getattr(self.client, method)(url).status_code
+                            for _ in statuses
+                        ],
+                        statuses,
+                    )
+        for url in self.get_urls(1000, 1000).values():
+            self.assertEqual(
+                self.client.delete(url).status_code,
+                status.HTTP_404_NOT_FOUND,
+            )
+
+    def test_concurrent_toggles(self):
+        failed = [status.HTTP_400_BAD_REQUEST] * (self.THREADS - 1)
+        for model, url in self.get_urls().items():
+            with self.subTest(model=model.__name__):
+                self.assertEqual(
+                    self.hammer('post', url),
+                    [status.HTTP_201_CREATED] + failed,
+                )
+                self.assertEqual(model.objects.count(), 1)
+                self.assertEqual(
+                    self.hammer('delete', url),
+                    [status.HTTP_204_NO_CONTENT] + failed,
+                )
+                self.assertFalse(model.objects.exists())
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.favorited_count, 0)
+
+
+class QueryBudgetMixin:
+    '''
+    Runs a request against a small and a large data set and checks that
+    the number of queries is the same for both and within the budget
+    declared for the endpoint in QUERY_BUDGETS.
+
+    The test case defines populate(size), which creates the data set and
+    returns the request callables by endpoint. Both run in a transaction
+    rolled back afterwards.
+    '''
+
+    QUERY_BUDGETS = {}
+    SIZES = (2, 8)
+
+    def count_queries(self, name, size):
+        with transaction.atomic():
+            request = self.populate(size)[name]
+            cache.clear()
+            with CaptureQueriesContext(connection) as context:
+                response = request()
+            if response.streaming:
+                b''.join(response.streaming_content)
+            self.assertLess(
+                response.status_code,
+                status.HTTP_400_BAD_REQUEST,
+                f'{name}: {response.status_code}',
+            )
+            transaction.set_rollback(True)
+        return len(context.captured_queries)
+
+    def check_query_budget(self, name):
+        counts = {size: self.count_queries(name, size) for size in self.SIZES}
+        self.assertEqual(
+            len(set(counts.values())),
+            1,
+            f'{name}: число запросов растёт с числом строк {counts}',
+        )
+        self.assertLessEqual(
+            max(counts.values()),
+            self.QUERY_BUDGETS[name],
+            f'{name}: превышен бюджет запросов {counts}',
+        )
+
+    def test_query_budgets(self):
+        for name in self.QUERY_BUDGETS:
+            with self.subTest(endpoint=name):
+                self.check_query_budget(name)
+
+
+class QueryBudgetTestCase(QueryBudgetMixin, RecipeListBaseTestCase):
+    QUERY_BUDGETS = {
+        'list': 6,
+        'retrieve': 6,
+        'create': 14,
+        'update': 22,
+        'favorite': 5,
+        'shopping_cart': 10,
+        'subscribe': 6,
+        'subscriptions': 4,
+        'download_shopping_cart': 1,
+    }
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.media_root = TemporaryDirectory()
+        media_root = override_settings(MEDIA_ROOT=cls.media_root.name)
+        media_root.enable()
+        cls.addClassCleanup(media_root.disable)
+        cls.addClassCleanup(cls.media_root.cleanup)
+        buffer = BytesIO()
+        Image.new('RGB', (2, 2)).save(buffer, 'PNG')
+        cls.image = (
+            'data:image/png;base64,' + b64encode(buffer.getvalue()).decode()
+        )
+
+    def create_author(self, number, recipes_count):
+        author = User.objects.create_user(
+            username=f'author{number}',
+            email=f'author{number}@ya.ru',
+            password='Qwerty!2',
+        )
+        Recipe.objects.bulk_create(
+            Recipe(
+                author=author,
+                name=f'Рецепт {number}.{i}',
+                image='recipes/images/image.png',
+                text='Описание',
+                cooking_time=10,
+            )
+            for i in range(recipes_count)
+        )
+        return author
+
+    def populate(self, size):
+        '''
+        The user has size recipes, each with size + 2 ingredients, in the
+        favorites and the cart and follows size + 1 authors.
+        '''
+        Ingredient.objects.bulk_create(
+            Ingredient(name=f'ингредиент {i}', measurement_unit='г')
+            for i in range(size)
+        )
+        self._create_recipes(size)
+        for number in range(size):
+            author = self.create_author(number, 1)
+            Subscription.objects.create(user=self.user, author=author)
+        new_author = self.create_author(size, size)
+        recipe = Recipe.objects.filter(author=new_author).first()
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(recipe=recipe, ingredient=ingredient, amount=1)
+            for ingredient in Ingredient.objects.all()
+        )
+        own_recipe = Recipe.objects.filter(author=self.author).first()
+        data = {
+            'ingredients': [
+                {'id': id, 'amount': 5}
+                for id in Ingredient.objects.values_list('id', flat=True)
+            ],
+            'tags': list(Tag.objects.values_list('id', flat=True)),
+            'name': 'Рецепт',
+            'text': 'Описание',
+            'cooking_time': 10,
+        }
+        user = APIClient()
+        user.force_authenticate(self.user)
+        author = APIClient()
+        author.force_authenticate(self.author)
+        recipe_url = reverse('recipes:recipe-detail', args=(recipe.id,))
+        return {
+            'list': lambda: user.get(f'{self.url_list}?limit={size}'),
+            'retrieve': lambda: user.get(recipe_url),
+            'create': lambda: user.post(
+                self.url_list, {**data, 'image': self.image}, format='json'
+            ),
+            'update': lambda: author.patch(
+                reverse('recipes:recipe-detail', args=(own_recipe.id,)),
+                data,
+                format='json',
+            ),
+            'favorite': lambda: user.post(recipe_url + 'favorite/'),
+            'shopping_cart': lambda: user.post(recipe_url + 'shopping_cart/'),
+            'subscribe': lambda: user.post(
+                reverse('users:user-subscribe', args=(new_author.id,))
+            ),
+            'subscriptions': lambda: user.get(
+                f"{reverse('users:user-subscriptions')}?limit={size}"
+            ),
+            'download_shopping_cart': lambda: user.get(
+                reverse('recipes:recipe-download-shopping-cart')
+            ),
+        }
@@ -0,0 +1,41 @@
+'''
+Data set versions kept in the shared cache.
+
+Cached values derived from a data set include its version in the key,
+so bumping the version invalidates them in every worker at once.
+'''
+
+from uuid import uuid4
+
+from django.core.cache import cache
+
+FAVORITES = 'favorites'
+INGREDIENTS = 'ingredients'
+RECIPES = 'recipes'
+SHOPPING_CART = 'shopping_cart'
+SUBSCRIPTIONS = 'subscriptions'
+TAGS = 'tags'
+USERS = 'users'
+
+KEY = 'version:{}'
+
+
+def user_namespace(namespace, user_id):
+    return f'{namespace}:{user_id}'
+
+
+def get_version(*namespaces):
+    keys = [KEY.format(namespace) for namespace in namespaces]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, uuid4().hex, None)
+            versions[key] = cache.get(key)
+    return ':'.join(versions[key] for key in keys)
+
+
+def bump_version(*namespaces):
+    cache.set_many(
+        {KEY.format(namespace): uuid4().hex for namespace in namespaces},
+        None,
+    )
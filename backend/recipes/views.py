@@ -1,74 +1,151 @@
-from django.db.models import Sum
-from django.http import HttpResponse
+from itertools import chain
+
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
-from rest_framework import filters, permissions, status, viewsets
+from rest_framework import permissions, status, viewsets
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.serializers import ValidationError
+from rest_framework.settings import api_settings
 
+from .exports import get_exports
 from .filters import RecipeFilter
-from .models import Ingredient, Recipe, RecipeIngredient, ShoppingCart, Tag
+from .images import schedule_variants
+from .mixins import (AnonymousCacheMixin, BulkRelationsMixin,
+                     ConditionalGetMixin)
+from .models import (Favorite, Ingredient, Recipe, RecipeIngredient,
+                     ShoppingCart, ShoppingListItem, Tag)
 from .pagination import RecipesPagination
 from .permissions import IsAdminOrReadOnly, IsOwnerOrAdminOrReadOnly
+from .relations import (create_relation, delete_relation, favorites_changed,
+                        shopping_cart_changed)
+from .search import ingredient_index
 from .serializers import (IS_FAVORITED, IS_IN_SHOPPING_CART,
                           FavoriteSerializer, IngredientSerializer,
                           RecipeListSerializer, RecipeSerializer,
                           TagSerializer)
+from .shopping_lists import get_cart_user_ids, refresh_shopping_lists
+from .snapshots import CatalogSnapshotMixin
+from .versions import (FAVORITES, INGREDIENTS, RECIPES, SHOPPING_CART,
+                       SUBSCRIPTIONS, TAGS, USERS, bump_version, get_version)
 
-FILENAME = 'shopping_cart.txt'
-NAME = 'recipe__recipe_ingredients__ingredient__name'
-UNIT = 'recipe__recipe_ingredients__ingredient__measurement_unit'
-AMOUNT = 'recipe__recipe_ingredients__amount'
+FILENAME = 'shopping_cart'
+FORMAT_PARAM = 'format'
+SHOPPING_LIST_CHUNK_SIZE = 500
+NAME = 'ingredient__name'
+UNIT = 'ingredient__measurement_unit'
 
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+class TagViewSet(CatalogSnapshotMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     pagination_class = None
     permission_classes = (IsAdminOrReadOnly,)
+    snapshot_namespaces = (TAGS,)
 
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+class IngredientViewSet(CatalogSnapshotMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     pagination_class = None
     permission_classes = (IsAdminOrReadOnly,)
-    filter_backends = (filters.SearchFilter,)
-    search_fields = ('name',)
+    snapshot_namespaces = (INGREDIENTS,)
+
+    def list(self, request, *args, **kwargs):
+        name = request.query_params.get(api_settings.SEARCH_PARAM)
+        if name:
+            return Response(ingredient_index.search(name))
+        return super().list(request, *args, **kwargs)
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(
+    ConditionalGetMixin,
+    AnonymousCacheMixin,
+    BulkRelationsMixin,
+    viewsets.ModelViewSet,
+):
     pagination_class = RecipesPagination
+    lookup_value_regex = r'\d+'
     permission_classes = (IsOwnerOrAdminOrReadOnly,)
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
+    cache_namespaces = (RECIPES, FAVORITES, TAGS, INGREDIENTS, USERS)
+    cache_query_params = (
+        'tags',
+        'author',
+        'ordering',
+        'page',
+        'limit',
+        'cursor',
+        IS_FAVORITED,
+        IS_IN_SHOPPING_CART,
+    )
+    validator_namespaces = (TAGS, INGREDIENTS)
+    validator_user_namespaces = (FAVORITES, SHOPPING_CART, SUBSCRIPTIONS)
 
     def _get_filtered_queryset(self, qs, key):
-        if qs and self.request.user.is_authenticated:
-            if key == IS_FAVORITED:
-                return qs.filter(favorite__user=self.request.user)
-            if key == IS_IN_SHOPPING_CART:
-                return qs.filter(shopping_cart__user=self.request.user)
+        if self.request.user.is_authenticated:
+            return qs.filter(**{key: True})
         return Recipe.objects.none()
 
+    def _get_annotated_queryset(self):
+        queryset = Recipe.objects.select_related('author')
+        user = self.request.user
+        if not user.is_authenticated:
+            return queryset
+        return queryset.annotate(
+            **{
+                IS_FAVORITED: Exists(
+                    Favorite.objects.filter(user=user, recipe=OuterRef('pk'))
+                ),
+                IS_IN_SHOPPING_CART: Exists(
+                    ShoppingCart.objects.filter(
+                        user=user, recipe=OuterRef('pk')
+                    )
+                ),
+            }
+        )
+
     def get_queryset(self):
-        queryset = Recipe.objects.all()
+        if self.action not in ('list', 'retrieve'):
+            return Recipe.objects.all()
+        queryset = self._get_annotated_queryset().prefetch_related(
+            'tags', 'ingredients', 'recipe_ingredients'
+        )
         for key in (IS_FAVORITED, IS_IN_SHOPPING_CART):
             if self.request.query_params.get(key):
                 queryset = self._get_filtered_queryset(queryset, key)
         return queryset
 
+    def get_validator_state(self):
+        if self.action == 'retrieve':
+            try:
+                updated_at = (
+                    Recipe.objects.filter(pk=self.kwargs['pk'])
+                    .values_list('updated_at', flat=True)
+                    .first()
+                )
+            except ValueError:
+                return None
+            if updated_at is None:
+                return None
+            # The author block is part of the recipe
+            return updated_at, (updated_at, get_version(USERS))
+        # The list state is the version of every data set it shows: no
+        # query runs, and the ETag changes with any change to recipes.
+        return None, get_version(RECIPES, FAVORITES, USERS)
+
     def get_serializer_class(self):
         if self.action in ('list', 'retrieve'):
             return RecipeListSerializer
-        else:
-            return RecipeSerializer
+        return RecipeSerializer
 
     def create(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
-        serializer.is_valid(raise_exception=True)
-        instance = self.perform_create_update(serializer)
+        instance = self.save_recipe(serializer)
         headers = self.get_success_headers(serializer.data)
         list_serializer = RecipeListSerializer(
             instance=instance, context={'request': request}
@@ -85,57 +162,105 @@ class RecipeViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer(
             instance, data=request.data, partial=partial
         )
-        serializer.is_valid(raise_exception=True)
-        self.perform_create_update(serializer)
+        self.save_recipe(serializer)
         list_serializer = RecipeListSerializer(
             instance=instance, context={'request': request}
         )
         return Response(list_serializer.data)
 
+    def save_recipe(self, serializer):
+        try:
+            serializer.is_valid(raise_exception=True)
+            return self.perform_create_update(serializer)
+        finally:
+            serializer.close_files()
+
+    @transaction.atomic
     def perform_create_update(self, serializer):
-        serializer.validated_data['author'] = self.request.user
-        ingredients = serializer.validated_data.pop('ingredients')
-        match self.request.method:
-            case 'POST':
-                serializer.instance = serializer.create(
-                    serializer.validated_data
-                )
-            case 'PATCH':
-                serializer.update(
-                    serializer.instance, serializer.validated_data
-                )
-                serializer.instance.recipe_ingredients.all().delete()
-        for item in ingredients:
-            ingredient = get_object_or_404(
-                Ingredient, id=item['ingredient'].id
-            )
-            RecipeIngredient.objects.create(
-                recipe=serializer.instance,
-                ingredient=ingredient,
-                amount=item['amount'],
+        ingredients = serializer.validated_data.pop('ingredients', None)
+        tags = serializer.validated_data.pop('tags', None)
+        # PUT and PATCH both update, the method only sets partial.
+        created = serializer.instance is None
+        if created:
+            serializer.validated_data['author'] = self.request.user
+            serializer.instance = serializer.create(serializer.validated_data)
+            Recipe.tags.through.objects.bulk_create(
+                Recipe.tags.through(recipe=serializer.instance, tag=tag)
+                for tag in tags
             )
+            schedule_variants(serializer.instance)
+        else:
+            if 'image' in serializer.validated_data:
+                serializer.validated_data['image_variants'] = {}
+            serializer.update(serializer.instance, serializer.validated_data)
+            if tags is not None:
+                serializer.instance.tags.set(tags)
+            if 'image' in serializer.validated_data:
+                schedule_variants(serializer.instance)
+        if ingredients is not None:
+            self.save_ingredients(serializer.instance, ingredients, created)
+        transaction.on_commit(lambda: bump_version(RECIPES))
         return serializer.instance
 
+    def save_ingredients(self, recipe, ingredients, created=False):
+        '''
+        Brings the recipe ingredients to the submitted state touching only
+        the rows that differ. A created recipe has no rows to compare.
+        '''
+        amounts = {
+            item['ingredient_id']: item['amount'] for item in ingredients
+        }
+        stored = (
+            {
+                item.ingredient_id: item
+                for item in recipe.recipe_ingredients.all()
+            }
+            if not created
+            else {}
+        )
+        deleted = [
+            item.id
+            for ingredient_id, item in stored.items()
+            if ingredient_id not in amounts
+        ]
+        if deleted:
+            RecipeIngredient.objects.filter(id__in=deleted).delete()
+        changed = []
+        for ingredient_id, item in stored.items():
+            if amounts.get(ingredient_id, item.amount) != item.amount:
+                item.amount = amounts[ingredient_id]
+                changed.append(item)
+        if changed:
+            RecipeIngredient.objects.bulk_update(changed, ('amount',))
+        added = [
+            RecipeIngredient(
+                recipe=recipe, ingredient_id=ingredient_id, amount=amount
+            )
+            for ingredient_id, amount in amounts.items()
+            if ingredient_id not in stored
+        ]
+        if added:
+            RecipeIngredient.objects.bulk_create(added)
+        # Deletions refresh the shopping lists through signals.
+        if not created and (changed or added):
+            refresh_shopping_lists(
+                get_cart_user_ids([recipe.id]),
+                [item.ingredient_id for item in changed + added],
+            )
+
     @action(
         methods=['post', 'delete'],
         detail=True,
         permission_classes=(permissions.IsAuthenticated,),
     )
     def favorite(self, request, pk):
-        recipe = get_object_or_404(Recipe, id=pk)
-        queryset = recipe.favorite.filter(user=request.user)
-        if request.method == 'DELETE':
-            if not queryset.exists():
-                raise ValidationError(
-                    {'errors': 'Рецепт в избранном не найден.'}
-                )
-            queryset.delete()
-            return Response(status=status.HTTP_204_NO_CONTENT)
-        if queryset.exists():
-            raise ValidationError({'errors': 'Рецепт уже есть в избранном.'})
-        recipe.favorite.create(user=request.user)
-        serializer = FavoriteSerializer(recipe)
-        return Response(serializer.data, status=status.HTTP_201_CREATED)
+        return self.toggle_relation(
+            request,
+            pk,
+            Favorite,
+            'Рецепт уже есть в избранном.',
+            'Рецепт в избранном не найден.',
+        )
 
     @action(
         methods=['post', 'delete'],
@@ -143,20 +268,45 @@ class RecipeViewSet(viewsets.ModelViewSet):
         permission_classes=(permissions.IsAuthenticated,),
     )
     def shopping_cart(self, request, pk):
-        recipe = get_object_or_404(Recipe, id=pk)
-        queryset = recipe.shopping_cart.filter(user=request.user)
+        return self.toggle_relation(
+            request,
+            pk,
+            ShoppingCart,
+            'Рецепт уже есть в списке покупок.',
+            'Рецепт в списке покупок не найден.',
+        )
+
+    @action(
+        methods=['post', 'delete'],
+        detail=False,
+        url_path='favorite',
+        permission_classes=(permissions.IsAuthenticated,),
+    )
+    def bulk_favorite(self, request):
+        return self.bulk_toggle_relations(
+            request, Recipe, Favorite, 'recipe_id', favorites_changed
+        )
+
+    @action(
+        methods=['post', 'delete'],
+        detail=False,
+        url_path='shopping_cart',
+        permission_classes=(permissions.IsAuthenticated,),
+    )
+    def bulk_shopping_cart(self, request):
+        return self.bulk_toggle_relations(
+            request, Recipe, ShoppingCart, 'recipe_id', shopping_cart_changed
+        )
+
+    def toggle_relation(self, request, pk, model, exists_error, missing_error):
         if request.method == 'DELETE':
-            if not queryset.exists():
-                raise ValidationError(
-                    {'errors': 'Рецепт в списке покупок не найден.'}
-                )
-            queryset.delete()
-            return Response(status=status.HTTP_204_NO_CONTENT)
-        if queryset.exists():
-            raise ValidationError(
-                {'errors': 'Рецепт уже есть в списке покупок.'}
-            )
-        recipe.shopping_cart.create(user=request.user)
+            if delete_relation(model, recipe_id=pk, user_id=request.user.id):
+                return Response(status=status.HTTP_204_NO_CONTENT)
+            get_object_or_404(Recipe, id=pk)
+            raise ValidationError({'errors': missing_error})
+        recipe = get_object_or_404(Recipe, id=pk)
+        if not create_relation(model, recipe_id=pk, user_id=request.user.id):
+            raise ValidationError({'errors': exists_error})
         serializer = FavoriteSerializer(recipe)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
@@ -166,23 +316,44 @@ class RecipeViewSet(viewsets.ModelViewSet):
         permission_classes=(permissions.IsAuthenticated,),
     )
     def download_shopping_cart(self, request):
-        ingerdients_in_cart = (
-            ShoppingCart.objects.filter(user=request.user)
-            .values(NAME)
-            .annotate(weight=Sum(AMOUNT))
-            .values(NAME, 'weight', UNIT)
-        )
-        if len(ingerdients_in_cart) == 0:
+        export_format = request.query_params.get(FORMAT_PARAM, 'txt')
+        exports = get_exports()
+        if export_format not in exports:
+            raise ValidationError(
+                {'errors': f'Доступные форматы: {", ".join(exports)}.'}
+            )
+        rows = self.get_shopping_list_rows(request.user)
+        first_row = next(rows, None)
+        if first_row is None:
             raise ValidationError(
                 {'errors': 'Сначала добавьте рецепты в список покупок.'}
             )
-        text = 'Список покупок:\n'
-        for i in ingerdients_in_cart:
-            text += f'{i[NAME]} ({i[UNIT]}) - {i["weight"]} \n'.capitalize()
-        return HttpResponse(
-            text,
+        export = exports[export_format]()
+        return StreamingHttpResponse(
+            export.stream(chain((first_row,), rows)),
             headers={
-                'Content-Type': 'text/plain; charset=UTF-8',
-                'Content-Disposition': f'attachment; filename="{FILENAME}"',
+                'Content-Type': export.content_type,
+                'Content-Disposition': (
+                    f'attachment; filename="{FILENAME}.{export_format}"'
+                ),
             },
         )
+
+    def get_shopping_list_rows(self, user):
+        '''
+        Yields (name, measurement_unit, amount) rows of the user's shopping
+        list, read with a server-side cursor.
+        '''
+        yield from (
+            ShoppingListItem.objects.filter(user=user)
+            .order_by(NAME, UNIT)
+            .values_list(NAME, UNIT, 'amount')
+            .iterator(chunk_size=SHOPPING_LIST_CHUNK_SIZE)
+        )
+
+    def perform_content_negotiation(self, request, force=False):
+        # The format parameter of download_shopping_cart selects the export
+        # format, not a renderer.
+        if self.action == 'download_shopping_cart':
+            force = True
+        return super().perform_content_negotiation(request, force)
@@ -0,0 +1,41 @@
+# Generated by Django 4.1 on 2026-10-18 15:00
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_recipes(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    User = apps.get_model('users', 'User')
+    User.objects.update(
+        recipes_count=Coalesce(
+            Subquery(
+                Recipe.objects.filter(author=OuterRef('pk'))
+                .order_by()
+                .values('author')
+                .annotate(count=Count('id'))
+                .values('count')
+            ),
+            0,
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0001_initial'),
+        ('recipes', '0006_recipe_favorited_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='recipes_count',
+            field=models.PositiveIntegerField(
+                default=0, editable=False, verbose_name='Количество рецептов'
+            ),
+        ),
+        migrations.RunPython(count_recipes, migrations.RunPython.noop),
+    ]
@@ -7,6 +7,9 @@ class User(AbstractUser):
     email = models.EmailField(_('email address'), max_length=254)
     first_name = models.CharField(_('first name'), max_length=150)
     last_name = models.CharField(_('last name'), max_length=150)
+    recipes_count = models.PositiveIntegerField(
+        'Количество рецептов', default=0, editable=False
+    )
 
     REQUIRED_FIELDS = ('email', 'first_name', 'last_name')
 
@@ -0,0 +1,18 @@
+from rest_framework.pagination import LimitOffsetPagination
+
+from recipes.counts import get_count
+from recipes.pagination import COUNT_STRATEGY_HEADER
+from recipes.versions import USERS
+
+
+class UsersPagination(LimitOffsetPagination):
+    count_namespaces = (USERS,)
+
+    def get_count(self, queryset):
+        count, self.count_strategy = get_count(queryset, self.count_namespaces)
+        return count
+
+    def get_paginated_response(self, data):
+        response = super().get_paginated_response(data)
+        response[COUNT_STRATEGY_HEADER] = self.count_strategy
+        return response
@@ -1,11 +1,27 @@
 from djoser import serializers as ds
 from rest_framework import serializers
 
+from recipes.fields import ImageVariantsField
 from recipes.models import Recipe
 
 from .models import Subscription, User
 
 
+def get_subscribed_ids(request):
+    '''
+    Returns ids of the authors the current user is subscribed to.
+    The ids are loaded once and kept on the request, so every serializer
+    rendered within the request answers is_subscribed from memory.
+    '''
+    if not hasattr(request, '_subscribed_ids'):
+        request._subscribed_ids = set(
+            Subscription.objects.filter(user=request.user).values_list(
+                'author_id', flat=True
+            )
+        )
+    return request._subscribed_ids
+
+
 class UserCreateSerializer(ds.UserCreateSerializer):
     class Meta:
         model = User
@@ -34,26 +50,24 @@ class UserSerializer(ds.UserSerializer):
         )
 
     def get_is_subscribed(self, obj):
-        return (
-            (user := self.context['request'].user)
-            and user.is_authenticated
-            and Subscription.objects.filter(user=user, author=obj).exists()
+        request = self.context['request']
+        return request.user.is_authenticated and obj.id in get_subscribed_ids(
+            request
         )
 
 
 class SubscriptionRecipeSerializer(serializers.ModelSerializer):
+    image_variants = ImageVariantsField()
+
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'image_variants', 'cooking_time')
 
 
 class SubscriptionSerializer(UserSerializer):
     recipes = SubscriptionRecipeSerializer(many=True, read_only=True)
-    recipes_count = serializers.SerializerMethodField()
 
     class Meta:
         model = UserSerializer.Meta.model
         fields = UserSerializer.Meta.fields + ('recipes', 'recipes_count')
-
-    def get_recipes_count(self, user):
-        return user.recipes.count()
+        read_only_fields = ('recipes_count',)
@@ -0,0 +1,25 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from recipes.relations import subscriptions_changed
+from recipes.versions import USERS, bump_version
+
+from .models import Subscription, User
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def users_changed(update_fields=None, **kwargs):
+    if update_fields != {'last_login'}:
+        transaction.on_commit(lambda: bump_version(USERS))
+
+
+@receiver(post_save, sender=Subscription)
+def subscription_created(instance, created, **kwargs):
+    subscriptions_changed(instance.user_id, [instance.author_id], int(created))
+
+
+@receiver(post_delete, sender=Subscription)
+def subscription_deleted(instance, **kwargs):
+    subscriptions_changed(instance.user_id, [instance.author_id], -1)
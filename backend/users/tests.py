@@ -1,7 +1,11 @@
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from rest_framework import status
 from rest_framework.reverse import reverse
 from rest_framework.test import APITestCase
 
+from recipes.models import Recipe
+
 
 class UserBaseTestCase(APITestCase):
     @classmethod
@@ -198,6 +202,12 @@ class SeveralUsersTestCase(UserBaseTestCase):
             self.assertIn(key, response.data)
         self.assertEqual(len(response.data['results']), self.PAGE_SIZE)
 
+    def test_users_list_count_strategy(self):
+        self._create_users(self.FEW_USERS_COUNT)
+        response = self.client.get(self.url)
+        self.assertEqual(response['X-Count-Strategy'], 'exact')
+        self.assertEqual(response.data['count'], self.FEW_USERS_COUNT + 1)
+
     def test_users_list_limit(self):
         self._create_users(self.USERS_COUNT)
         response = self.client.get(f'{self.url}?limit={self.LIMIT_SIZE}')
@@ -283,6 +293,22 @@ class SubscriptionTestCase(UserBaseTestCase):
         )
         self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
 
+    def test_bulk_subscribe(self):
+        self._authorize()
+        url = self.url + 'subscribe/'
+        ids = [self.second_user_id, self.user_id, self.NON_EXIST_USER_ID]
+        for method, statuses in (
+            (self.client.post, ['created', 'not_found', 'not_found']),
+            (self.client.post, ['exists', 'not_found', 'not_found']),
+            (self.client.delete, ['deleted', 'not_found', 'not_found']),
+        ):
+            response = method(url, {'ids': ids}, format='json')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(
+                [result['status'] for result in response.data['results']],
+                statuses,
+            )
+
     def test_unauthorized_subscribe(self):
         self._unauthorize()
         url = (
@@ -306,6 +332,57 @@ class SubscriptionTestCase(UserBaseTestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(len(response.data['results']), self.PAGE_SIZE)
 
+    def _create_recipes(self, author_id, count):
+        for i in range(count):
+            Recipe.objects.create(
+                author_id=author_id,
+                name=f'Рецепт {i}',
+                image='recipes/images/image.png',
+                text='Описание',
+                cooking_time=10,
+            )
+
+    def test_is_subscribed_queries(self):
+        ids = self._create_users(self.USERS_COUNT)
+        for id in ids:
+            self._create_recipes(id, self.LIMIT_SIZE)
+        self._subscribe(ids)
+        for url in (self.url, self.url_subscriptons):
+            counts = []
+            for limit in (self.FEW_USERS_COUNT, self.PAGE_SIZE):
+                with CaptureQueriesContext(connection) as context:
+                    response = self.client.get(f'{url}?limit={limit}')
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                self.assertEqual(len(response.data['results']), limit)
+                counts.append(len(context.captured_queries))
+            self.assertEqual(counts[0], counts[1])
+
+    def test_subscriptions_recipes_limit(self):
+        self._create_recipes(self.second_user_id, self.LIMIT_SIZE)
+        self._subscribe([self.second_user_id])
+        latest = list(
+            Recipe.objects.filter(author_id=self.second_user_id).values_list(
+                'id', flat=True
+            )
+        )
+        for recipes_limit in range(self.LIMIT_SIZE + 2):
+            with self.subTest(recipes_limit=recipes_limit):
+                response = self.client.get(
+                    f'{self.url_subscriptons}?recipes_limit={recipes_limit}'
+                )
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                result = response.data['results'][0]
+                self.assertEqual(result['recipes_count'], self.LIMIT_SIZE)
+                self.assertEqual(
+                    [recipe['id'] for recipe in result['recipes']],
+                    latest[:recipes_limit],
+                )
+        for recipes_limit in ('-1', 'abc'):
+            response = self.client.get(
+                f'{self.url_subscriptons}?recipes_limit={recipes_limit}'
+            )
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
     def test_unauthorized_subscriptions(self):
         self._unauthorize()
         response = self.client.get(self.url_subscriptons)
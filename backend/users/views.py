@@ -1,11 +1,17 @@
+from django.db.models import OuterRef, Prefetch, Subquery
 from django.shortcuts import get_object_or_404
 from djoser import views
 from rest_framework import permissions, serializers, status
 from rest_framework.decorators import action
-from rest_framework.pagination import LimitOffsetPagination
 from rest_framework.response import Response
 
-from .models import User
+from recipes.mixins import BulkRelationsMixin
+from recipes.models import Recipe
+from recipes.relations import (create_relation, delete_relation,
+                               subscriptions_changed)
+
+from .models import Subscription, User
+from .pagination import UsersPagination
 from .serializers import SubscriptionSerializer
 
 
@@ -16,45 +22,91 @@ class TokenCreateView(views.TokenCreateView):
         return response
 
 
-class UserViewSet(views.UserViewSet):
-    pagination_class = LimitOffsetPagination
+class UserViewSet(BulkRelationsMixin, views.UserViewSet):
+    pagination_class = UsersPagination
+    lookup_value_regex = r'\d+'
     permission_classes = (permissions.IsAuthenticated,)
 
+    def get_recipes_limit(self):
+        recipes_limit = self.request.query_params.get('recipes_limit')
+        if recipes_limit is None:
+            return None
+        try:
+            recipes_limit = int(recipes_limit)
+            if recipes_limit < 0:
+                raise ValueError
+        except ValueError:
+            raise serializers.ValidationError(
+                {'recipes_limit': 'Укажите неотрицательное целое число.'}
+            )
+        return recipes_limit
+
+    def get_subscriptions_queryset(self):
+        '''
+        Authors with their latest recipes limited by recipes_limit.
+        The limit is applied per author by the database.
+        '''
+        recipes = Recipe.objects.only(
+            'id', 'author', 'name', 'image', 'image_variants', 'cooking_time'
+        )
+        recipes_limit = self.get_recipes_limit()
+        if recipes_limit is not None:
+            recipes = recipes.filter(
+                id__in=Subquery(
+                    Recipe.objects.filter(author=OuterRef('author')).values(
+                        'id'
+                    )[:recipes_limit]
+                )
+            )
+        return User.objects.prefetch_related(
+            Prefetch('recipes', queryset=recipes)
+        )
+
     @action(methods=['post', 'delete'], detail=True)
     def subscribe(self, request, id):
-        author = get_object_or_404(User, id=id)
-        queryset = author.subscribes.filter(user=request.user)
         if request.method == 'DELETE':
-            if not queryset.exists():
-                raise serializers.ValidationError(
-                    {'errors': 'Подписка не найдена.'}
-                )
-            queryset.delete()
-            return Response(status=status.HTTP_204_NO_CONTENT)
+            if delete_relation(
+                Subscription, author_id=id, user_id=request.user.id
+            ):
+                return Response(status=status.HTTP_204_NO_CONTENT)
+            get_object_or_404(User, id=id)
+            raise serializers.ValidationError(
+                {'errors': 'Подписка не найдена.'}
+            )
+        author = get_object_or_404(self.get_subscriptions_queryset(), id=id)
         if author == request.user:
             raise serializers.ValidationError(
                 {'errors': 'Подписка на самого себя.'}
             )
-        if queryset.exists():
+        if not create_relation(
+            Subscription, author_id=id, user_id=request.user.id
+        ):
             raise serializers.ValidationError(
                 {'errors': 'Подписка уже существует.'}
             )
-        author.subscribes.create(user=request.user)
         serializer = SubscriptionSerializer(
             author, context={'request': request}
         )
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
+    @action(methods=['post', 'delete'], detail=False, url_path='subscribe')
+    def bulk_subscribe(self, request):
+        return self.bulk_toggle_relations(
+            request,
+            User,
+            Subscription,
+            'author_id',
+            subscriptions_changed,
+            exclude=[request.user.id],
+        )
+
     @action(methods=['get'], detail=False)
     def subscriptions(self, request):
-        subscribes = User.objects.filter(subscribes__user=request.user).all()
+        subscribes = self.get_subscriptions_queryset().filter(
+            subscribes__user=request.user
+        )
         page = self.paginate_queryset(subscribes)
         serializer = SubscriptionSerializer(
             page, many=True, context={'request': request}
         )
-        recipes_limit = request.query_params.get('recipes_limit')
-        if recipes_limit is not None:
-            recipes_limit = int(recipes_limit)
-            for i, item in enumerate(serializer.data):
-                serializer.data[i]['recipes'] = item['recipes'][:recipes_limit]
         return self.get_paginated_response(serializer.data)